@@ -1,5 +1,5 @@
 
-import functional.part5.parserCombinatorApplicativeWithLazyOr._
+import functional.part5.parserCombinatorStackSafe._
 import functional.part5.jsonParser._
 
 
@@ -18,3 +18,11 @@ array.run(Location("[true,[12.6,14.2],{\"a\":[],\"b\":true},\"word\"]"))
 
 
 objectP.run(Location("{\"name\":\"john\",\"age\":29,\"address\":{\"street\":\"Hertzel\",\"no\":12}}"))
+
+
+// Documents nested thousands of levels deep (e.g. generated ones) overflow the stack when the parsers run
+// directly, the trampolined interpreter runs the same parsers without growing the stack
+
+val deeplyNested = "[" * 100000 + "]" * 100000
+
+array.run(Location(deeplyNested), Interpreter.Trampolined)
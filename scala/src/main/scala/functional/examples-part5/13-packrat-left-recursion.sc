@@ -0,0 +1,21 @@
+import functional.part3.applicative._
+import functional.part3.functor._
+import functional.part3.monad._
+import functional.part5.parserCombinatorMonadLooseEnds.{Parser => P, _}
+import functional.part5.parserCombinatorPackrat._
+
+// Arithmetic is naturally left recursive (1-2-3 is (1-2)-3), without memo defining
+// difference in terms of itself would recurse forever at the same offset
+
+lazy val number: P[Int] = memo(Monad[P].map(P.regex("\\d+".r), _.toInt))
+
+lazy val difference: P[Int] =
+  memo(Monad[P].map(difference ** (P.str("-") >> number), (a, b) => a - b) | number)
+
+difference.parse("7")
+difference.parse("1-2-3")
+difference.parse("10-1-1-1")
+difference.parse("10-")
+
+// a single memo table for the whole parse
+parse(difference, "100-10-1")
@@ -2,8 +2,8 @@ package functional.part5
 
 import functional.part3.applicative._
 import functional.part3.functor._
-import functional.part5.parserCombinatorApplicativeWithLazyOr._
-import functional.part5.parserCombinatorApplicativeWithLazyOr.Parser._
+import functional.part5.parserCombinatorStackSafe._
+import functional.part5.parserCombinatorStackSafe.Parser._
 
 object jsonParser {
 
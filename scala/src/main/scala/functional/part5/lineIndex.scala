@@ -0,0 +1,40 @@
+package functional.part5
+
+import java.util
+import java.util.Collections
+
+// Resolves offsets in an input into lines and columns by binary searching the offsets where
+// the input's lines start, instead of counting newlines from the start of the input on every call.
+// The line starts are built once per input and shared by all its locations.
+object lineIndex {
+
+  // a line and column (both starting from 1), without the input they are in
+  case class Position(line: Int, column: Int)
+
+  // the keys are weak so an input's line starts are dropped together with the input, strings
+  // compare by reference first so looking up the same input doesn't compare its characters
+  private val cache: util.Map[String, Array[Int]] =
+    Collections.synchronizedMap(new util.WeakHashMap[String, Array[Int]]())
+
+  // the sorted offsets where the lines of the input start, the first line starts at 0 and
+  // every other one right after a '\n'
+  def lineStarts(input: String): Array[Int] = cache.computeIfAbsent(input, s => {
+    val starts = Array.newBuilder[Int]
+    starts += 0
+    var i = s.indexOf('\n')
+    while (i >= 0) {
+      starts += i + 1
+      i = s.indexOf('\n', i + 1)
+    }
+    starts.result()
+  })
+
+  // the character at offset is on the last line starting at or before it, except for a '\n'
+  // which counts as column 0 of the line after it, the same as counting the newlines up to offset
+  def position(input: String, offset: Int): Position = {
+    val starts = lineStarts(input)
+    val found = util.Arrays.binarySearch(starts, offset + 1)
+    val line = if (found >= 0) found else -found - 2
+    Position(line + 1, offset - starts(line) + 1)
+  }
+}
@@ -18,12 +18,11 @@ object parserCombinatorApplicativeWithBetterQuanitfiers {
     def advance(by: Int): Location = this.copy(offset = this.offset + by)
 
     // useful getters for understanding the position in the string
-    def getLine(): Int = input.slice(0, offset + 1).count(_ == '\n') + 1
+    def getLine(): Int = position.line
 
-    def getColumn(): Int = input.slice(0, offset + 1).lastIndexOf('\n') match {
-      case -1 => offset + 1
-      case lastLineStart => offset - lastLineStart
-    }
+    def getColumn(): Int = position.column
+
+    def position: lineIndex.Position = lineIndex.position(input, offset)
   }
 
 
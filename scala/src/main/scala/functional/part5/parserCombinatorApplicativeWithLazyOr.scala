@@ -4,7 +4,7 @@ import functional.part3.applicative._
 import functional.part3.functor._
 
 import scala.annotation.tailrec
-import scala.collection.mutable
+import scala.collection.{Factory, mutable}
 import scala.util.matching.Regex
 import scala.util.matching.Regex.Match
 
@@ -18,12 +18,11 @@ object parserCombinatorApplicativeWithLazyOr {
     def advance(by: Int): Location = this.copy(offset = this.offset + by)
 
     // useful getters for understanding the position in the string
-    def getLine(): Int = input.slice(0, offset + 1).count(_ == '\n') + 1
+    def getLine(): Int = position.line
 
-    def getColumn(): Int = input.slice(0, offset + 1).lastIndexOf('\n') match {
-      case -1 => offset + 1
-      case lastLineStart => offset - lastLineStart
-    }
+    def getColumn(): Int = position.column
+
+    def position: lineIndex.Position = lineIndex.position(input, offset)
   }
 
 
@@ -75,14 +74,16 @@ object parserCombinatorApplicativeWithLazyOr {
     def optional(): Parser[Option[A]] =
       Applicative[Parser].map(this, Some(_)) | Applicative[Parser].pure(None)
 
-    // derived from repeat and atMost
-    def times(minimum: Int, maximum: Int): Parser[List[A]] =
-      Applicative[Parser].map2(this.repeat(minimum), this.atMost(maximum - minimum), (p1, p2) => p1 ++ p2)
+    def times(minimum: Int, maximum: Int): Parser[List[A]] = manyTo[List[A]](List, minimum, maximum)
 
     // BETTER QUNTIFIERS, defined as basic parsers (a low level implmentation, not through combinators)
     def repeat(times: Int): Parser[List[A]] = Parser.repeat(this, times)
     def atMost(times: Int): Parser[List[A]] = Parser.atMost(this, times)
 
+    // the same quantifiers, collecting into any collection, e.g. p.manyTo(Vector) or p.manyTo(ArraySeq)
+    def manyTo[C](factory: Factory[A, C], minimum: Int = 0, maximum: Int = Int.MaxValue): Parser[C] =
+      Parser.manyTo(this, minimum, maximum, factory)
+
     def zeroOrMoreTimes(): Parser[List[A]] = times(0, Int.MaxValue)
     def oneOrMoreTimes(): Parser[List[A]] = times(1, Int.MaxValue)
 
@@ -184,49 +185,37 @@ object parserCombinatorApplicativeWithLazyOr {
 
     // BETTER QUANTIFIERS: We can't define them the way we want with combinators, lets just make them into basic
     // operations, and we will have it efficient by implementing it with a tail recursion
-    def repeat[A](pa: Parser[A], times: Int): Parser[List[A]] = Parser(
-      loc => {
-
-        @tailrec
-        def go(collected: List[A], location: Location, n: Int): Result[List[A]] = {
-          if (n <= 0){
-            Success(collected, location)
-          } else {
-            pa.run(location) match {
-              case err@Failure(_) => err
-              case Success(v, nextLocation) =>
-                go(v :: collected, nextLocation, n - 1)
-            }
-          }
-        }
 
-        // we assembled the list in the opposite order for efficiency, now we reverse it to get the correct order
-        Functor[Result].map(go(List.empty, loc, times), _.reverse)
-      }
-    )
-
-    def atMost[A](pa: Parser[A], times: Int): Parser[List[A]] = Parser(
+    // Collects between minimum and maximum results of pa straight into the factory's builder
+    // (e.g. List, Vector or ArraySeq), counting them in a counter so every item takes the same
+    // time however many were already collected, and without reversing anything at the end
+    def manyTo[A, C](pa: Parser[A], minimum: Int, maximum: Int, factory: Factory[A, C]): Parser[C] = Parser(
       loc => {
+        val builder = factory.newBuilder
 
         @tailrec
-        def go(collected: List[A], location: Location, n: Int): Result[List[A]] = {
-          if (n <= 0){
-            Success(collected, location)
+        def go(location: Location, count: Int): Result[C] = {
+          if (count >= maximum) {
+            Success(builder.result(), location)
           } else {
             pa.run(location) match {
               case err@Failure(_) =>
-                Success(collected, location) // The only difference between this implementation and repeat
+                if (count < minimum) err else Success(builder.result(), location)
               case Success(v, nextLocation) =>
-                go(v :: collected, nextLocation, n - 1)
+                builder += v
+                go(nextLocation, count + 1)
             }
           }
         }
 
-        // we assembled the list in the opposite order for efficiency, now we reverse it to get the correct order
-        Functor[Result].map(go(List.empty, loc, times), _.reverse)
+        go(loc, 0)
       }
     )
 
+    def repeat[A](pa: Parser[A], times: Int): Parser[List[A]] = manyTo[A, List[A]](pa, times, times, List)
+
+    def atMost[A](pa: Parser[A], times: Int): Parser[List[A]] = manyTo[A, List[A]](pa, 0, times, List)
+
   }
 
 }
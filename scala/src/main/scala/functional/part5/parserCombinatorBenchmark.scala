@@ -0,0 +1,79 @@
+package functional.part5
+
+import functional.part3.applicative._
+import functional.part3.functor._
+import functional.part3.monad._
+import functional.part5.parserCombinatorMonadLooseEnds._
+import functional.part5.parserCombinatorPackrat._
+import functional.part5.parserCombinatorStackSafe.Interpreter
+
+// Regression benchmarks for the parser combinators on multi-megabyte inputs.
+// Every benchmark runs on inputs of doubling sizes, the time per MB should stay about the same
+// as the input grows, a growing time per MB means parsing became super-linear again.
+object parserCombinatorBenchmark {
+
+  val sizes: List[Int] = List(1, 2, 4, 8).map(_ * 1024 * 1024)
+
+  // counts the matches of p until the end of the input, looping with tailRecM to keep the
+  // benchmark independent of the quantifiers
+  def countAll[A](p: Parser[A]): Parser[Int] =
+    p.tailRecM[Int, Int](0)(count =>
+      Monad[Parser].map[A, Either[Int, Int]](p, _ => Left(count + 1)) | Monad[Parser].pure(Right(count))
+    )
+
+  // the input of the given size, made of the repeated text
+  def repeated(text: String, size: Int): String = text * (size / text.length)
+
+  def time[A](f: => A): (A, Double) = {
+    val start = System.nanoTime()
+    val result = f
+    (result, (System.nanoTime() - start) / 1e6)
+  }
+
+  // left recursive arithmetic, every offset is memoized so the inputs are smaller
+  lazy val number: Parser[Long] = memo(Monad[Parser].map(Parser.regex("\\d+".r), _.toLong))
+
+  lazy val product: Parser[Long] =
+    memo(Monad[Parser].map(product ** (Parser.str("*") >> number), (a, b) => a * b) | number)
+
+  lazy val sum: Parser[Long] =
+    memo(Monad[Parser].map(sum ** (Parser.str("+") >> product), (a, b) => a + b) | product)
+
+  def run[A](name: String, parser: Parser[A], input: Int => String, inputSizes: List[Int] = sizes): Unit =
+    runParse(name, text => parse(parser, text), input, inputSizes)
+
+  // the same, for parsers not built on parserCombinatorMonadLooseEnds
+  def runParse(name: String, parse: String => Either[Any, Any], input: Int => String, inputSizes: List[Int]): Unit = {
+    println(name)
+    // warmup, so the JIT compiles the parsers before measuring
+    parse(input(inputSizes.head))
+
+    inputSizes.foreach { size =>
+      val text = input(size)
+      val (result, ms) = time(parse(text))
+      val mb = text.length.toDouble / (1024 * 1024)
+      assert(result.isRight, s"$name failed on ${mb}MB: $result")
+      println(f"  $mb%5.1fMB: $ms%9.1fms (${ms / mb}%7.1fms/MB)")
+    }
+  }
+
+  def main(args: Array[String]): Unit = {
+    run("str: repeated literal", countAll(Parser.str("token ")), repeated("token ", _))
+    run("regex: words and spaces", countAll(Parser.regex("\\w+\\s*".r)), repeated("lorem ipsum dolor sit amet ", _))
+    run(
+      "regex and str: key value pairs",
+      countAll(Parser.regex("[a-z]+".r) ** (Parser.str("=") >> Parser.regex("\\d+".r) << Parser.str(";"))),
+      repeated("key=12345;value=678;", _)
+    )
+    run("packrat: left recursive sums of products", sum, size => "1" + repeated("+2*3", size), sizes.map(_ / 8))
+
+    // the json parser runs with the direct and trampolined interpreters, only the trampolined one
+    // can parse the deeply nested arrays
+    val flatArray = (size: Int) => "[" + repeated("true,-13.7,\"word\",[1,2],", size) + "false]"
+    val nestedArrays = (size: Int) => "[" * (size / 2) + "]" * (size / 2)
+    val smallSizes = sizes.map(_ / 8)
+    runParse("json: flat array, direct", jsonParser.array.parse(_, Interpreter.Direct), flatArray, smallSizes)
+    runParse("json: flat array, trampolined", jsonParser.array.parse(_, Interpreter.Trampolined), flatArray, smallSizes)
+    runParse("json: nested arrays, trampolined", jsonParser.array.parse(_, Interpreter.Trampolined), nestedArrays, smallSizes)
+  }
+}
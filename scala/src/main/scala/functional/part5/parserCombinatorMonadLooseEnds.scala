@@ -4,8 +4,9 @@ import functional.part3.applicative._
 import functional.part3.functor._
 import functional.part3.monad._
 
+import java.util.regex.Matcher
 import scala.annotation.tailrec
-import scala.collection.mutable
+import scala.collection.{Factory, mutable}
 import scala.util.matching.Regex
 import scala.util.matching.Regex.Match
 
@@ -19,12 +20,11 @@ object parserCombinatorMonadLooseEnds {
     def advance(by: Int): Location = this.copy(offset = this.offset + by)
 
     // useful getters for understanding the position in the string
-    def getLine(): Int = input.slice(0, offset + 1).count(_ == '\n') + 1
+    def getLine(): Int = position.line
 
-    def getColumn(): Int = input.slice(0, offset + 1).lastIndexOf('\n') match {
-      case -1 => offset + 1
-      case lastLineStart => offset - lastLineStart
-    }
+    def getColumn(): Int = position.column
+
+    def position: lineIndex.Position = lineIndex.position(input, offset)
   }
 
   // location will indicate where the error happened and some message about what went wrong
@@ -112,17 +112,17 @@ object parserCombinatorMonadLooseEnds {
     def optional(): Parser[Option[A]] =
       Applicative[Parser].map(this, Some(_)) | Applicative[Parser].pure(None)
 
-    // derived from repeat and atMost
-    def times(minimum: Int, maximum: Int): Parser[List[A]] =
-      Applicative[Parser].map2(this.repeat(minimum), this.atMost(maximum - minimum), (p1, p2) => p1 ++ p2)
+    def times(minimum: Int, maximum: Int): Parser[List[A]] = manyTo[List[A]](List, minimum, maximum)
 
     // BETTER QUNTIFIERS, defined as basic parsers (a low level implmentation, not through combinators)
     def repeat(times: Int): Parser[List[A]] = Parser.repeat(this, times)
 
     def atMost(times: Int): Parser[List[A]] = Parser.atMost(this, times)
 
-    // these definition are fine but because of atMost implemnetation this will actually
-    // crash the stack :(
+    // the same quantifiers, collecting into any collection, e.g. p.manyTo(Vector) or p.manyTo(ArraySeq)
+    def manyTo[C](factory: Factory[A, C], minimum: Int = 0, maximum: Int = Int.MaxValue): Parser[C] =
+      Parser.manyTo(this, minimum, maximum, factory)
+
     def zeroOrMoreTimes(): Parser[List[A]] = times(0, Int.MaxValue)
 
     def oneOrMoreTimes(): Parser[List[A]] = times(1, Int.MaxValue)
@@ -162,9 +162,11 @@ object parserCombinatorMonadLooseEnds {
 
   object Parser {
 
+    // the primitives match in place at the offset, copying the rest of the input on every attempt
+    // (with substring) would make parsing quadratic in the input's length
     def str(expected: String): Parser[String] = Parser {
       loc =>
-        if (loc.input.substring(loc.offset).startsWith(expected)) {
+        if (loc.input.startsWith(expected, loc.offset)) {
           Success(
             expected,
             loc.advance(expected.length)
@@ -180,49 +182,68 @@ object parserCombinatorMonadLooseEnds {
         }
     }
 
-    def regex(expectedRegex: Regex): Parser[String] = Parser {
-      loc =>
-        expectedRegex.findPrefixOf(loc.input.substring(loc.offset)) match {
-          case Some(m) =>
-            Success(
-              m.toString,
-              loc.advance(m.length)
-            )
-          case None =>
-            Failure(
-              ParserError(
-                loc,
-                f"Expected '/${expectedRegex.pattern}/' at ${loc.offset}"
-                  + f" but got '${loc.input.slice(loc.offset, loc.offset + 10)}'"
+    def regex(expectedRegex: Regex): Parser[String] = {
+      // a matcher is stateful, so every thread gets its own, created once and reset for every match
+      val matchers: ThreadLocal[Matcher] = ThreadLocal.withInitial(() => expectedRegex.pattern.matcher(""))
+
+      Parser {
+        loc =>
+          val matcher = matchers.get().reset(loc.input).region(loc.offset, loc.input.length)
+          try {
+            if (matcher.lookingAt()) {
+              val m = matcher.group()
+              Success(
+                m,
+                loc.advance(m.length)
               )
-            )
-        }
+            } else {
+              Failure(
+                ParserError(
+                  loc,
+                  f"Expected '/${expectedRegex.pattern}/' at ${loc.offset}"
+                    + f" but got '${loc.input.slice(loc.offset, loc.offset + 10)}'"
+                )
+              )
+            }
+          } finally {
+            // the matcher outlives the parse, so it shouldn't keep the input alive
+            matcher.reset("")
+          }
+      }
     }
 
     // BETTER QUANTIFIERS: We can't define them the way we want with combinators, lets just make them into basic
     // operations, and we will have it efficient by implementing it with a tail recursion
-    def repeat[A](pa: Parser[A], times: Int): Parser[List[A]] =
-      Monad[Parser].map(
-        pa.tailRecM[List[A], List[A]](List.empty)(
-          lst =>
-            if (lst.length == times) {
-              Monad[Parser].pure(Right(lst))
-            } else {
-              Monad[Parser].map(pa, r => Left(r :: lst))
+
+    // Collects between minimum and maximum results of pa straight into the factory's builder
+    // (e.g. List, Vector or ArraySeq), counting them in a counter so every item takes the same
+    // time however many were already collected, and without reversing anything at the end
+    def manyTo[A, C](pa: Parser[A], minimum: Int, maximum: Int, factory: Factory[A, C]): Parser[C] = Parser(
+      loc => {
+        val builder = factory.newBuilder
+
+        @tailrec
+        def go(location: Location, count: Int): Result[C] = {
+          if (count >= maximum) {
+            Success(builder.result(), location)
+          } else {
+            pa.run(location) match {
+              case err@Failure(_) =>
+                if (count < minimum) err else Success(builder.result(), location)
+              case Success(v, nextLocation) =>
+                builder += v
+                go(nextLocation, count + 1)
             }
-        ), _.reverse)
+          }
+        }
 
+        go(loc, 0)
+      }
+    )
 
-    def atMost[A](pa: Parser[A], times: Int): Parser[List[A]] =
-      Monad[Parser].map(
-        pa.tailRecM[List[A], List[A]](List.empty)(
-          lst =>
-            if (lst.length == times) {
-              Monad[Parser].pure(Right(lst))
-            } else {
-              Monad[Parser].map(pa, r => Left(r :: lst)) | Monad[Parser].pure(Right(lst))
-            }
-        ), _.reverse)
+    def repeat[A](pa: Parser[A], times: Int): Parser[List[A]] = manyTo[A, List[A]](pa, times, times, List)
+
+    def atMost[A](pa: Parser[A], times: Int): Parser[List[A]] = manyTo[A, List[A]](pa, 0, times, List)
 
 
     val EOF: Parser[Unit] = Parser(
@@ -0,0 +1,101 @@
+package functional.part5
+
+import functional.part5.parserCombinatorMonadLooseEnds._
+
+import java.util.concurrent.atomic.AtomicInteger
+import scala.annotation.tailrec
+import scala.collection.mutable
+
+// Packrat parsing for the parsers of parserCombinatorMonadLooseEnds: a memoized parser stores its
+// result at every offset it runs at, so backtracking into it again (e.g. from another alternative
+// of an or) is only a lookup, and with the alternatives memoized parsing takes linear time.
+//
+// Memoized parsers can also be directly left recursive (e.g. sum = sum + product | product),
+// which would otherwise recurse at the same offset until the stack overflows. This uses the seed
+// growing of Warth et al: the recursive call fails at first, so the parser takes a non recursive
+// alternative (the seed), and then the parser is re-run with its last result as the result of
+// the recursive call for as long as that consumes more of the input.
+object parserCombinatorPackrat {
+
+  // the result of a parser at an offset, inProgress while the parser is running there
+  private final class Entry(var result: Result[Any], var inProgress: Boolean, var leftRecursive: Boolean)
+
+  // the memoized results of a single parse, keyed by the parser's id and the offset
+  private final class MemoTable(val input: String) {
+    val entries: mutable.LongMap[Entry] = mutable.LongMap.empty
+  }
+
+  private val ids = new AtomicInteger()
+
+  private val currentTable = new ThreadLocal[MemoTable]
+
+  private def key(id: Int, offset: Int): Long = (id.toLong << 32) | offset
+
+  // runs f with the memo table of the running parse of the input, or with a new table that
+  // lasts until f returns when there is no such parse
+  private def withTable[A](input: String)(f: MemoTable => A): A = {
+    val outer = currentTable.get()
+    if (outer != null && (outer.input eq input)) {
+      f(outer)
+    } else {
+      val table = new MemoTable(input)
+      currentTable.set(table)
+      try f(table) finally currentTable.set(outer)
+    }
+  }
+
+  // The parser is taken by name so it can refer to the memoized parser being defined, e.g.
+  //   lazy val sum: Parser[Int] = memo(Monad[Parser].map(sum ** (str("+") >> number), (a, b) => a + b) | number)
+  // Only direct left recursion is supported, the recursive reference must not go through another
+  // memoized parser at the same offset (which would memoize the seed instead of the grown result).
+  def memo[A](p: => Parser[A]): Parser[A] = {
+    val id = ids.getAndIncrement()
+    lazy val parser = p
+    Parser(loc => withTable(loc.input)(table => run(id, parser, loc, table)))
+  }
+
+  // parses the input with a single memo table shared by all the memoized parsers in p, rather
+  // than a table per top level memoized parser
+  def parse[A](p: Parser[A], input: String): Either[ParserError, A] =
+    withTable(input)(_ => p.parse(input))
+
+  private def run[A](id: Int, p: Parser[A], loc: Location, table: MemoTable): Result[A] = {
+    val k = key(id, loc.offset)
+    table.entries.get(k) match {
+      case Some(entry) =>
+        // a call of the parser at the offset it's already running at is a left recursion
+        if (entry.inProgress) {
+          entry.leftRecursive = true
+        }
+        entry.result.asInstanceOf[Result[A]]
+      case None =>
+        val seed = Failure(ParserError(loc, f"Left recursion at ${loc.offset}"))
+        val entry = Entry(seed, inProgress = true, leftRecursive = false)
+        table.entries(k) = entry
+
+        val first = p.run(loc)
+        val result = if (entry.leftRecursive) grow(p, loc, entry, first) else first
+        entry.result = result
+        entry.inProgress = false
+        result
+    }
+  }
+
+  // re-runs the parser at loc with the last result in the memo table (as the result of the
+  // recursive call) while it keeps consuming more, and results in the longest one
+  private def grow[A](p: Parser[A], loc: Location, entry: Entry, seed: Result[A]): Result[A] = {
+
+    @tailrec
+    def go(seed: Result[A]): Result[A] = seed match {
+      case Success(_, seedLocation) =>
+        entry.result = seed
+        p.run(loc) match {
+          case grown@Success(_, location) if location.offset > seedLocation.offset => go(grown)
+          case _ => seed
+        }
+      case _ => seed
+    }
+
+    go(seed)
+  }
+}
@@ -0,0 +1,417 @@
+package functional.part5
+
+import functional.part3.applicative._
+import functional.part3.functor._
+import functional.part3.monad.Monad
+
+import java.util.regex.Matcher
+import scala.annotation.tailrec
+import scala.collection.{Factory, mutable}
+import scala.util.matching.Regex
+
+// The parsers of parserCombinatorApplicativeWithLazyOr (and flatMap), but instead of a run function
+// a parser is a description of what to run (a tree of combinators over primitive parsers), which
+// is then run by an interpreter. The same parsers can be run by two interpreters:
+// - Direct, which runs a parser by recursively running its parts, so every level of nesting in
+//   the input adds calls to the stack, and deeply nested inputs overflow it
+// - Trampolined, which runs a parser in a loop, and keeps what's left to do with the results of
+//   the parts in a stack of its own on the heap, so nesting is only limited by memory
+object parserCombinatorStackSafe {
+
+  // represents a location in the parsed string, input is the full string, offset is where
+  // the current parsing head is
+  case class Location(input: String, offset: Int = 0) {
+
+    // conveniance: build a new location by advancing the current one
+    def advance(by: Int): Location = this.copy(offset = this.offset + by)
+
+    // useful getters for understanding the position in the string
+    def getLine(): Int = position.line
+
+    def getColumn(): Int = position.column
+
+    def position: lineIndex.Position = lineIndex.position(input, offset)
+  }
+
+  // location will indicate where the error happened and some message about what went wrong
+  case class ParserError(loc: Location, msg: String)
+
+  // This is basically a specialized Either with nicer names and only a single generic param
+  sealed trait Result[+A] {
+    // it's good to have an easy way to convert to an actual either
+    def toEither: Either[ParserError, (A, Location)] = this match {
+      case Failure(err) => Left(err)
+      case Success(v, loc) => Right((v, loc))
+    }
+  }
+
+  case class Success[+A](get: A, location: Location) extends Result[A]
+
+  case class Failure[+A](get: ParserError) extends Result[Nothing]
+
+  given Functor[Result] with {
+    def map[A, B](fa: Result[A], f: A => B): Result[B] = fa match {
+      case err@Failure(_) => err
+      case Success(v, offset) => Success(f(v), offset)
+    }
+  }
+
+  enum Interpreter {
+    case Direct, Trampolined
+  }
+
+  // parser
+  sealed trait Parser[+A] {
+
+    def run(loc: Location, interpreter: Interpreter = Interpreter.Direct): Result[A] = (interpreter match {
+      case Interpreter.Direct => runDirect(this, loc)
+      case Interpreter.Trampolined => runTrampolined(this, loc)
+    }).asInstanceOf[Result[A]]
+
+    def parse(input: String, interpreter: Interpreter = Interpreter.Direct): Either[ParserError, A] =
+      (this << Parser.EOF).run(Location(input), interpreter)
+        .toEither
+        .map(_._1)
+
+    // Add ability to change the errors, not just the results (similar to eithers mapLeft)
+    def mapError(f: ParserError => ParserError): Parser[A] = MapError(this, f)
+
+    def desc(name: String): Parser[A] = this.mapError(err =>
+      ParserError(err.loc, f"Expected '$name' at ${err.loc.offset}" +
+        f" but found: ${err.loc.input.slice(err.loc.offset, err.loc.offset + 10)}")
+    )
+
+    def or[B >: A](pb: => Parser[B]): Parser[B] = Parser.or(this, pb)
+
+    inline def |[B >: A](pb: => Parser[B]): Parser[B] = Parser.or(this, pb)
+
+    def optional(): Parser[Option[A]] =
+      Applicative[Parser].map(this, Some(_)) | Applicative[Parser].pure(None)
+
+    def times(minimum: Int, maximum: Int): Parser[List[A]] = manyTo[List[A]](List, minimum, maximum)
+
+    def repeat(times: Int): Parser[List[A]] = Parser.repeat(this, times)
+
+    def atMost(times: Int): Parser[List[A]] = Parser.atMost(this, times)
+
+    // the same quantifiers, collecting into any collection, e.g. p.manyTo(Vector) or p.manyTo(ArraySeq)
+    def manyTo[C](factory: Factory[A, C], minimum: Int = 0, maximum: Int = Int.MaxValue): Parser[C] =
+      Parser.manyTo(this, minimum, maximum, factory)
+
+    def zeroOrMoreTimes(): Parser[List[A]] = times(0, Int.MaxValue)
+
+    def oneOrMoreTimes(): Parser[List[A]] = times(1, Int.MaxValue)
+
+    // quantifiers with delimiters
+    def oneOrMoreTimes[B](delimiterParser: Parser[B]): Parser[List[A]] =
+      Applicative[Parser].map(this ** (delimiterParser >> this).zeroOrMoreTimes(), (h, t) => h :: t)
+
+    def zeroOrMoreTimes[B](delimiterParser: Parser[B]): Parser[List[A]] =
+      oneOrMoreTimes(delimiterParser) | Applicative[Parser].pure(List.empty)
+
+    def oneOrMoreTimes(delimiter: String): Parser[List[A]] =
+      this.oneOrMoreTimes(Parser.str(delimiter))
+
+    def zeroOrMoreTimes(delimiter: String): Parser[List[A]] =
+      this.zeroOrMoreTimes(Parser.str(delimiter))
+  }
+
+  // ------------------ //
+  // The parser algebra //
+  // ------------------ //
+
+  // The nodes are untyped (every node is a parser of any result, which Parser[Nothing] is a subtype
+  // of), the types are checked by the combinators building them and the interpreters only pass
+  // the results along.
+
+  private final class Primitive(val f: Location => Result[Any]) extends Parser[Nothing]
+
+  private final class Mapped(val pa: Parser[Any], val f: Any => Any) extends Parser[Nothing]
+
+  private final class Map2(val pa: Parser[Any], val pb: Parser[Any], val f: (Any, Any) => Any) extends Parser[Nothing]
+
+  private final class FlatMap(val pa: Parser[Any], val f: Any => Parser[Any]) extends Parser[Nothing]
+
+  // the second parser is lazy, like in parserCombinatorApplicativeWithLazyOr, so parsers can refer to
+  // themselves, and it's only built once
+  private final class Or(val pa: Parser[Any], pb: => Parser[Any]) extends Parser[Nothing] {
+    lazy val second: Parser[Any] = pb
+  }
+
+  private final class MapError(val pa: Parser[Any], val f: ParserError => ParserError) extends Parser[Nothing]
+
+  private final class Many(val pa: Parser[Any], val minimum: Int, val maximum: Int, val factory: Factory[Any, Any])
+    extends Parser[Nothing]
+
+  // ------------ //
+  // Interpreters //
+  // ------------ //
+
+  private def runDirect(p: Parser[Any], loc: Location): Result[Any] = p match {
+    case node: Primitive => node.f(loc)
+    case node: Mapped =>
+      runDirect(node.pa, loc) match {
+        case Success(a, l) => Success(node.f(a), l)
+        case err@Failure(_) => err
+      }
+    case node: Map2 =>
+      runDirect(node.pa, loc) match {
+        case Success(a, l1) =>
+          runDirect(node.pb, l1) match {
+            case Success(b, l2) => Success(node.f(a, b), l2)
+            case err@Failure(_) => err
+          }
+        case err@Failure(_) => err
+      }
+    case node: FlatMap =>
+      runDirect(node.pa, loc) match {
+        case Success(a, l) => runDirect(node.f(a), l)
+        case err@Failure(_) => err
+      }
+    case node: Or =>
+      runDirect(node.pa, loc) match {
+        case succ@Success(_, _) => succ
+        case Failure(_) => runDirect(node.second, loc)
+      }
+    case node: MapError =>
+      runDirect(node.pa, loc) match {
+        case succ@Success(_, _) => succ
+        case Failure(err) => Failure(node.f(err))
+      }
+    case node: Many =>
+      val builder = node.factory.newBuilder
+
+      @tailrec
+      def go(location: Location, count: Int): Result[Any] = {
+        if (count >= node.maximum) {
+          Success(builder.result(), location)
+        } else {
+          runDirect(node.pa, location) match {
+            case err@Failure(_) =>
+              if (count < node.minimum) err else Success(builder.result(), location)
+            case Success(v, nextLocation) =>
+              builder += v
+              go(nextLocation, count + 1)
+          }
+        }
+      }
+
+      go(loc, 0)
+  }
+
+  // what's left to do with the result of a part of a parser in the trampolined interpreter,
+  // a frame is popped from the stack when the part is done and gets its result
+  private sealed trait Frame
+
+  private final class ThenMap(val f: Any => Any) extends Frame
+
+  private final class ThenSecond(val pb: Parser[Any], val f: (Any, Any) => Any) extends Frame
+
+  private final class ThenCombine(val a: Any, val f: (Any, Any) => Any) extends Frame
+
+  private final class ThenBind(val f: Any => Parser[Any]) extends Frame
+
+  private final class OrElse(val or: Or, val loc: Location) extends Frame
+
+  private final class ThenMapError(val f: ParserError => ParserError) extends Frame
+
+  private final class NextItem(
+    val many: Many,
+    val builder: mutable.Builder[Any, Any],
+    var count: Int,
+    var location: Location
+  ) extends Frame
+
+  private def runTrampolined(p: Parser[Any], loc: Location): Result[Any] = {
+    val frames = mutable.Stack.empty[Frame]
+
+    // either there's a next parser to run at location, or (when next is null) the result
+    // of the last one is passed to the frame at the top of the stack
+    var next: Parser[Any] = p
+    var location = loc
+    var result: Result[Any] = null
+
+    while (next != null || frames.nonEmpty) {
+      if (next != null) {
+        next match {
+          case node: Primitive =>
+            result = node.f(location)
+            next = null
+          case node: Mapped =>
+            frames.push(ThenMap(node.f))
+            next = node.pa
+          case node: Map2 =>
+            frames.push(ThenSecond(node.pb, node.f))
+            next = node.pa
+          case node: FlatMap =>
+            frames.push(ThenBind(node.f))
+            next = node.pa
+          case node: Or =>
+            frames.push(OrElse(node, location))
+            next = node.pa
+          case node: MapError =>
+            frames.push(ThenMapError(node.f))
+            next = node.pa
+          case node: Many =>
+            val builder = node.factory.newBuilder
+            if (node.maximum <= 0) {
+              result = Success(builder.result(), location)
+              next = null
+            } else {
+              frames.push(NextItem(node, builder, 0, location))
+              next = node.pa
+            }
+        }
+      } else {
+        // failures pass through every frame except OrElse, NextItem and ThenMapError
+        (frames.pop(), result) match {
+          case (frame: ThenMap, Success(a, l)) =>
+            result = Success(frame.f(a), l)
+          case (frame: ThenSecond, Success(a, l)) =>
+            frames.push(ThenCombine(a, frame.f))
+            next = frame.pb
+            location = l
+          case (frame: ThenCombine, Success(b, l)) =>
+            result = Success(frame.f(frame.a, b), l)
+          case (frame: ThenBind, Success(a, l)) =>
+            next = frame.f(a)
+            location = l
+          case (frame: OrElse, Failure(_)) =>
+            next = frame.or.second
+            location = frame.loc
+          case (frame: ThenMapError, Failure(err)) =>
+            result = Failure(frame.f(err))
+          case (frame: NextItem, Success(v, l)) =>
+            frame.builder += v
+            frame.count += 1
+            frame.location = l
+            if (frame.count >= frame.many.maximum) {
+              result = Success(frame.builder.result(), l)
+            } else {
+              frames.push(frame)
+              next = frame.many.pa
+              location = l
+            }
+          case (frame: NextItem, Failure(_)) =>
+            if (frame.count >= frame.many.minimum) {
+              result = Success(frame.builder.result(), frame.location)
+            }
+          case _ =>
+        }
+      }
+    }
+
+    result
+  }
+
+  // functor applicative and monad for parser, every combinator builds a node
+  given Monad[Parser] with {
+
+    def pure[A](a: A): Parser[A] = Parser {
+      loc => Success(a, loc) // pure values don't consume anything from the input
+    }
+
+    def flatMap[A, B](pa: Parser[A], f: A => Parser[B]): Parser[B] =
+      FlatMap(pa, f.asInstanceOf[Any => Parser[Any]])
+
+    override def map[A, B](fa: Parser[A], f: A => B): Parser[B] =
+      Mapped(fa, f.asInstanceOf[Any => Any])
+
+    override def map2[A, B, C](pa: Parser[A], pb: Parser[B], f: (A, B) => C): Parser[C] =
+      Map2(pa, pb, f.asInstanceOf[(Any, Any) => Any])
+
+    override def ap[A, B](fa: Parser[A], ff: Parser[A => B]): Parser[B] =
+      map2(ff, fa, (f, a) => f(a))
+  }
+
+  // Product will be very useful so lets create an operator for it
+  extension[A, B] (pa: Parser[A]) {
+
+    def **(pb: Parser[B]): Parser[(A, B)] = Applicative[Parser].product(pa, pb)
+
+  }
+
+  // --------------------------------- //
+  // Basic concrete parsers definition //
+  // --------------------------------- //
+
+  object Parser {
+
+    // a primitive parser, running the function in both interpreters
+    def apply[A](run: Location => Result[A]): Parser[A] = Primitive(run)
+
+    def str(expected: String): Parser[String] = Parser {
+      loc =>
+        if (loc.input.startsWith(expected, loc.offset)) {
+          Success(
+            expected,
+            loc.advance(expected.length)
+          )
+        } else {
+          Failure(
+            ParserError(
+              loc,
+              f"Expected '$expected' at ${loc.offset}"
+                + f" but got '${loc.input.slice(loc.offset, loc.offset + expected.length)}'"
+            )
+          )
+        }
+    }
+
+    def regex(expectedRegex: Regex): Parser[String] = {
+      // a matcher is stateful, so every thread gets its own, created once and reset for every match
+      val matchers: ThreadLocal[Matcher] = ThreadLocal.withInitial(() => expectedRegex.pattern.matcher(""))
+
+      Parser {
+        loc =>
+          val matcher = matchers.get().reset(loc.input).region(loc.offset, loc.input.length)
+          try {
+            if (matcher.lookingAt()) {
+              val m = matcher.group()
+              Success(
+                m,
+                loc.advance(m.length)
+              )
+            } else {
+              Failure(
+                ParserError(
+                  loc,
+                  f"Expected '/${expectedRegex.pattern}/' at ${loc.offset}"
+                    + f" but got '${loc.input.slice(loc.offset, loc.offset + 10)}'"
+                )
+              )
+            }
+          } finally {
+            // the matcher outlives the parse, so it shouldn't keep the input alive
+            matcher.reset("")
+          }
+      }
+    }
+
+    def or[A](pa: Parser[A], pb: => Parser[A]): Parser[A] = Or(pa, pb)
+
+    def manyTo[A, C](pa: Parser[A], minimum: Int, maximum: Int, factory: Factory[A, C]): Parser[C] =
+      Many(pa, minimum, maximum, factory.asInstanceOf[Factory[Any, Any]])
+
+    def repeat[A](pa: Parser[A], times: Int): Parser[List[A]] = manyTo[A, List[A]](pa, times, times, List)
+
+    def atMost[A](pa: Parser[A], times: Int): Parser[List[A]] = manyTo[A, List[A]](pa, 0, times, List)
+
+    val EOF: Parser[Unit] = Parser(
+      loc => {
+        if (loc.offset == loc.input.length) {
+          Success((), loc)
+        } else {
+          Failure(
+            ParserError(
+              loc,
+              f"Expected 'EOF' at ${loc.offset}"
+                + f" but got '${loc.input.slice(loc.offset, loc.offset + 10)}'"
+            )
+          )
+        }
+      }
+    )
+  }
+
+}
@@ -0,0 +1,27 @@
+import { performance } from "perf_hooks";
+import { parseStructuralQueries } from "../spikeQueryBatch";
+
+// Benchmark reporting the throughput of parseStructuralQueries as the number of workers grows
+//
+// run with: npx ts-node src/parser/__benchmarks__/batch.bench.ts
+
+const terms = ["abc", "$[e=LOC|CITY]founded", "<U1>cap_1:[w=foo]bar", "`two words`", "42", "t=NN"];
+const queries = Array.from({ length: 100000 }, (_, i) => {
+  const length = 3 + (i % 10);
+  return Array.from({ length }, (__, j) => terms[(i + j * 7) % terms.length]).join(" ") + ` q${i}`;
+});
+
+async function main() {
+  for (const workers of [1, 2, 4, 8]) {
+    for (const compiled of [false, true]) {
+      const start = performance.now();
+      // eslint-disable-next-line no-await-in-loop
+      await parseStructuralQueries(queries, { workers, compiled });
+      const seconds = (performance.now() - start) / 1000;
+      const mode = compiled ? "compiled" : "interpreted";
+      console.log(`${workers} worker(s), ${mode.padEnd(11)} ${Math.round(queries.length / seconds)} queries/sec`);
+    }
+  }
+}
+
+main();
@@ -0,0 +1,14 @@
+import { parseStructuralQuery } from "../spikeQuery";
+import { timeIt } from "./utils";
+
+// Benchmark comparing the interpreted and compiled spikeQuery parsers
+//
+// run with: npx ts-node src/parser/__benchmarks__/compile.bench.ts
+
+const short = "abc $[e=LOC|CITY]founded <U1>cap_1:[w=foo]bar";
+const long = Array(1000).fill(short).join(" ");
+
+timeIt("short query, interpreted", 100000, () => parseStructuralQuery(short));
+timeIt("short query, compiled", 100000, () => parseStructuralQuery(short, { compiled: true }));
+timeIt("long query, interpreted", 100, () => parseStructuralQuery(long));
+timeIt("long query, compiled", 100, () => parseStructuralQuery(long, { compiled: true }));
@@ -0,0 +1,22 @@
+import { Parser as P } from "../parserCombinator";
+import { timeIt } from "./utils";
+
+// Micro-benchmark for heavy backtracking, where most alternatives share their first character
+// so they're all attempted, and almost every failure is discarded by or/optional.
+//
+// run with: npx ts-node src/parser/__benchmarks__/failures.bench.ts
+
+const keyword = P.alternatives(
+  P.str("select"), P.str("set"), P.str("show"), P.str("start"), P.regex(/s\w*/),
+);
+const statement = P.sequence(keyword, P.str("!").optional(), P.str("?").optional());
+const statements = statement.zeroOrMoreTimes({ delimiter: " " });
+
+const input = Array.from({ length: 2000 }, (_, i) => ["sample", "stop", "start!", "sx?"][i % 4]).join(" ");
+
+console.log(`input size: ${input.length} characters`);
+
+timeIt("backtracking, interpreted", 200, () => statements.parse(input));
+const compiled = P.compile(statements);
+timeIt("backtracking, compiled", 200, () => compiled.parse(input));
+timeIt("failing parse, interpreted", 200, () => statements.parse(`${input} !`));
@@ -0,0 +1,20 @@
+import { Parser as P } from "../parserCombinator";
+import { parseStructuralQuery } from "../spikeQuery";
+import { timeIt } from "./utils";
+
+// Benchmark for the quantifier combinators on inputs with 10k terms
+//
+// run with: npx ts-node src/parser/__benchmarks__/quantifiers.bench.ts
+
+const terms = 10000;
+
+const letters = "a".repeat(terms);
+const delimited = Array(terms).fill("a").join(",");
+const query = Array(terms).fill("abc $[e=LOC]def :ghi").join(" ");
+
+const a = P.str("a");
+
+timeIt("repeat(10k)", 100, () => a.repeat(terms).parse(letters));
+timeIt("zeroOrMoreTimes over 10k items", 100, () => a.zeroOrMoreTimes().parse(letters));
+timeIt("oneOrMoreTimes with delimiter over 10k items", 100, () => a.oneOrMoreTimes({ delimiter: "," }).parse(delimited));
+timeIt("parseStructuralQuery with 30k terms", 10, () => parseStructuralQuery(query));
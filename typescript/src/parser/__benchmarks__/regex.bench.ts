@@ -0,0 +1,36 @@
+import { Parser as P } from "../parserCombinator";
+import { parseStructuralQuery } from "../spikeQuery";
+import { timeIt } from "./utils";
+
+// Micro-benchmark for Parser.regex on ~10 KB inputs, comparing the anchored sticky
+// matching against the previous approach of executing the regex on the remaining input
+// and rejecting matches that don't start at index 0.
+//
+// run with: npx ts-node src/parser/__benchmarks__/regex.bench.ts
+
+function unanchoredMatch(r: RegExp, input: string, offset: number): string | undefined {
+  const match = r.exec(input.substring(offset));
+  return match != null && match.index === 0 ? match[0] : undefined;
+}
+
+const size = 10 * 1024;
+const words = "abc and def $[e=LOC|CITY]founded <U1>cap_1:[w=foo]bar 42 ";
+const query = words.repeat(Math.ceil(size / words.length)).substring(0, size).trim();
+const noDigits = "x".repeat(size);
+
+const numberRegex = /-?\d+(\.\d+)?/;
+const numberParser = P.regex(numberRegex);
+
+console.log(`input size: ${query.length} characters`);
+
+// a failed match where the pattern does not appear anywhere in the input,
+// previously this scanned the entire remaining input before failing
+timeIt("failed match, unanchored exec", 10000, () => unanchoredMatch(numberRegex, noDigits, 0));
+timeIt("failed match, Parser.regex", 10000, () => numberParser.parsePartial({ input: noDigits, offset: 0 }));
+
+// a failed match in the middle of the input, previously the remaining input was also copied
+timeIt("failed match at mid input, unanchored exec", 10000, () => unanchoredMatch(numberRegex, noDigits, size / 2));
+timeIt("failed match at mid input, Parser.regex", 10000, () => numberParser.parsePartial({ input: noDigits, offset: size / 2 }));
+
+// end to end parsing of a full query
+timeIt("parseStructuralQuery", 100, () => parseStructuralQuery(query));
@@ -0,0 +1,155 @@
+import { Parser as P } from "../parserCombinator";
+import { parseStructuralQuery } from "../spikeQuery";
+import { benchmark, BenchmarkResult, formatResult, seededRandom } from "./utils";
+
+// Benchmark suite for the parser combinators and the SPIKE query parser, over synthetic
+// inputs generated from a fixed seed so every run parses the same inputs.
+// Prints a line per benchmark, or a single JSON document with --json to track regressions
+// across commits. Benchmarks can be selected with --filter <substring of their name>, and each
+// one runs for at least --min-time milliseconds (1000 by default).
+//
+// run with: npx ts-node src/parser/__benchmarks__/suite.bench.ts [--json] [--filter name] [--min-time ms]
+// allocated bytes are only reported when running with: node --expose-gc -r ts-node/register ...
+
+const rand = seededRandom(42);
+const pick = <A>(values: Array<A>): A => values[Math.floor(rand() * values.length)];
+const times = <A>(n: number, f: (i: number) => A): Array<A> => Array.from({ length: n }, (_, i) => f(i));
+
+// ------------- //
+// SPIKE queries //
+// ------------- //
+
+const words = ["founded", "the", "company", "in", "was", "born", "Paris", "1999", "`New York`", "it's"];
+const fields = ["w", "l", "t", "e", "word", "lemma", "tag", "entity"];
+const values = ["LOC", "CITY", "NNP", "{places}", "`two words`", "found"];
+
+const constraints = (count: number) => `[${times(count, () => (
+  `${pick(fields)}=${times(1 + Math.floor(rand() * 3), () => pick(values)).join("|")}`
+)).join("&")}]`;
+
+const term = (): string => {
+  const r = rand();
+  if (r < 0.6) return pick(words);
+  if (r < 0.8) return `$${constraints(1)}${pick(words)}`;
+  return `<E>cap:${constraints(1)}${pick(words)}`;
+};
+
+const queries = {
+  short: times(100, () => times(3 + Math.floor(rand() * 4), term).join(" ")),
+  long: times(10, () => times(500, term).join(" ")),
+  constrained: times(100, () => times(4, () => `$${constraints(6)}${pick(words)}`).join(" ")),
+  // long words are first tried as capture names, and only then as tokens
+  backtracking: times(100, () => times(20, () => `${pick(words)}_${pick(words)}_${pick(words)}`).join(" ")),
+  failing: times(100, () => `${times(10, term).join(" ")} $[w=`),
+};
+
+// ----------------- //
+// JSON-like parsing //
+// ----------------- //
+
+// a parser for JSON without escapes in strings, recursion goes through bind
+type Json = null | boolean | number | string | Array<Json> | {[key: string]: Json};
+
+const lazy = <A>(f: () => P<A>): P<A> => {
+  let p: P<A> | undefined;
+  return P.success(undefined).bind(() => {
+    if (p === undefined) {
+      p = f();
+    }
+    return p;
+  });
+};
+const ws = P.regex(/\s*/);
+const token = (s: string) => P.str(s).skip(ws);
+const jsonString = P.regex(/"[^"]*"/).map((s) => s.substring(1, s.length - 1)).skip(ws);
+const jsonNumber = P.regex(/-?\d+(\.\d+)?/).map(Number).skip(ws);
+
+const json: P<Json> = lazy(() => P.alternatives<Json>(
+  jsonString,
+  jsonNumber,
+  token("true").result<Json>(true),
+  token("false").result<Json>(false),
+  token("null").result<Json>(null),
+  token("[").then(json.zeroOrMoreTimes({ delimiterParser: token(",") })).skip(token("]")),
+  token("{")
+    .then(P.product(jsonString.skip(token(":")), json).zeroOrMoreTimes({ delimiterParser: token(",") }))
+    .skip(token("}"))
+    .map((entries) => Object.fromEntries(entries)),
+));
+
+const jsonValue = (depth: number): Json => {
+  if (depth === 0 || rand() < 0.3) {
+    return pick<Json>([1.5, -42, "text", true, false, null]);
+  }
+  if (rand() < 0.5) {
+    return times(1 + Math.floor(rand() * 5), () => jsonValue(depth - 1));
+  }
+  return Object.fromEntries(times(1 + Math.floor(rand() * 5), (i) => [`key${i}`, jsonValue(depth - 1)]));
+};
+
+const jsonInputs = {
+  small: JSON.stringify(times(5, () => jsonValue(3))),
+  nested: JSON.stringify(times(200, () => jsonValue(6)), null, 1),
+};
+
+Object.values(jsonInputs).forEach((input) => {
+  if (json.parse(input).type === "failure") {
+    throw new Error("the json parser should parse all the generated inputs");
+  }
+});
+
+// ------------------- //
+// Pathological inputs //
+// ------------------- //
+
+const items = 100000;
+const a = P.str("a");
+const letters = "a".repeat(items);
+const delimited = times(items, () => "a").join(",");
+const wordList = times(items, () => pick(["abc", "de", "f"])).join(" ");
+
+// ---------- //
+// Benchmarks //
+// ---------- //
+
+const parseAll = (parse: (input: string) => unknown, inputs: Array<string>) => () => inputs.forEach(parse);
+const compiledQuery = (q: string) => parseStructuralQuery(q, { compiled: true });
+const compiledJson = P.compile(json);
+
+const benchmarks: Array<[string, () => void]> = [
+  ["spike: 100 short queries", parseAll(parseStructuralQuery, queries.short)],
+  ["spike: 100 short queries, compiled", parseAll(compiledQuery, queries.short)],
+  ["spike: 10 long queries (500 terms)", parseAll(parseStructuralQuery, queries.long)],
+  ["spike: 10 long queries (500 terms), compiled", parseAll(compiledQuery, queries.long)],
+  ["spike: 100 deeply constrained queries", parseAll(parseStructuralQuery, queries.constrained)],
+  ["spike: 100 backtrack heavy queries", parseAll(parseStructuralQuery, queries.backtracking)],
+  ["spike: 100 failing queries", parseAll(parseStructuralQuery, queries.failing)],
+  [`json: small (${jsonInputs.small.length} chars)`, () => json.parse(jsonInputs.small)],
+  [`json: nested (${jsonInputs.nested.length} chars)`, () => json.parse(jsonInputs.nested)],
+  [`json: nested (${jsonInputs.nested.length} chars), compiled`, () => compiledJson.parse(jsonInputs.nested)],
+  ["pathological: zeroOrMoreTimes over 100k items", () => a.zeroOrMoreTimes().parse(letters)],
+  ["pathological: delimited zeroOrMoreTimes over 100k items", () => a.zeroOrMoreTimes({ delimiter: "," }).parse(delimited)],
+  ["pathological: 100k words", () => P.regex(/\w+/).zeroOrMoreTimes({ delimiter: " " }).parse(wordList)],
+];
+
+const args = process.argv.slice(2);
+const asJson = args.includes("--json");
+const filterIndex = args.indexOf("--filter");
+const filter = filterIndex >= 0 ? args[filterIndex + 1] : undefined;
+const minTimeIndex = args.indexOf("--min-time");
+const minTime = minTimeIndex >= 0 ? Number(args[minTimeIndex + 1]) : undefined;
+
+const results: Array<BenchmarkResult> = [];
+benchmarks
+  .filter(([name]) => filter === undefined || name.includes(filter))
+  .forEach(([name, f]) => {
+    const result = benchmark(name, f, { minTime });
+    results.push(result);
+    if (!asJson) {
+      console.log(formatResult(result));
+    }
+  });
+
+if (asJson) {
+  console.log(JSON.stringify({ node: process.version, date: new Date().toISOString(), results }, null, 2));
+}
@@ -0,0 +1,109 @@
+import { performance } from "perf_hooks";
+
+// mulberry32, a small seeded pseudo random generator of numbers in [0, 1), used by the
+// benchmarks and the tests so their inputs can be reproduced
+export function seededRandom(seed: number): () => number {
+  let state = seed;
+  return () => {
+    state = (state + 0x6d2b79f5) | 0;
+    let t = Math.imul(state ^ (state >>> 15), 1 | state);
+    t = (t + Math.imul(t ^ (t >>> 7), 61 | t)) ^ t;
+    return ((t ^ (t >>> 14)) >>> 0) / 4294967296;
+  };
+}
+
+// the same, generating integers in [0, n)
+export function seededRandomInt(seed: number): (n: number) => number {
+  const random = seededRandom(seed);
+  return (n) => Math.floor(random() * n);
+}
+
+// runs f for the given number of iterations (after a short warmup) and prints the time per operation
+export function timeIt(name: string, iterations: number, f: () => void): void {
+  for (let i = 0; i < Math.min(iterations, 100); i++) f();
+
+  const start = performance.now();
+  for (let i = 0; i < iterations; i++) f();
+  const elapsed = performance.now() - start;
+  console.log(`${name.padEnd(50)} ${((elapsed * 1000) / iterations).toFixed(3).padStart(12)} µs/op`);
+}
+
+export interface BenchmarkResult {
+  name: string;
+  iterations: number;
+  opsPerSec: number;
+  // latency percentiles of a single operation in milliseconds
+  p50: number;
+  p99: number;
+  // heap bytes allocated per operation, undefined unless node runs with --expose-gc
+  allocatedBytes?: number;
+}
+
+function percentile(sorted: Array<number>, p: number): number {
+  return sorted[Math.min(sorted.length - 1, Math.floor((sorted.length * p) / 100))];
+}
+
+// The heap growth over a few operations right after a full GC, which is close to what they
+// allocate as long as they don't trigger a GC themselves, so the smallest sample is kept
+function allocatedBytes(f: () => void): number | undefined {
+  const { gc } = global as {gc?: () => void};
+  if (gc === undefined) {
+    return undefined;
+  }
+  let smallest = Infinity;
+  for (let sample = 0; sample < 5; sample++) {
+    gc();
+    const before = process.memoryUsage().heapUsed;
+    f();
+    const allocated = process.memoryUsage().heapUsed - before;
+    if (allocated >= 0) {
+      smallest = Math.min(smallest, allocated);
+    }
+  }
+  return smallest === Infinity ? undefined : smallest;
+}
+
+// Times every operation separately, until minTime milliseconds were spent (and at least
+// minIterations were done) after a warmup of the same length
+export function benchmark(
+  name: string,
+  f: () => void,
+  opts?: {minTime?: number; minIterations?: number},
+): BenchmarkResult {
+  const minTime = opts?.minTime ?? 1000;
+  const minIterations = opts?.minIterations ?? 5;
+
+  const warmupEnd = performance.now() + minTime / 2;
+  while (performance.now() < warmupEnd) f();
+
+  const samples: Array<number> = [];
+  let total = 0;
+  while (total < minTime || samples.length < minIterations) {
+    const start = performance.now();
+    f();
+    const elapsed = performance.now() - start;
+    samples.push(elapsed);
+    total += elapsed;
+  }
+
+  samples.sort((a, b) => a - b);
+  return {
+    name,
+    iterations: samples.length,
+    opsPerSec: (samples.length * 1000) / total,
+    p50: percentile(samples, 50),
+    p99: percentile(samples, 99),
+    allocatedBytes: allocatedBytes(f),
+  };
+}
+
+export function formatResult(r: BenchmarkResult): string {
+  const allocated = r.allocatedBytes === undefined ? "n/a" : `${(r.allocatedBytes / 1024).toFixed(1)} KB`;
+  return [
+    r.name.padEnd(50),
+    `${r.opsPerSec.toFixed(1).padStart(12)} ops/s`,
+    `p50 ${r.p50.toFixed(3).padStart(10)} ms`,
+    `p99 ${r.p99.toFixed(3).padStart(10)} ms`,
+    `${allocated.padStart(12)}/op`,
+  ].join("  ");
+}
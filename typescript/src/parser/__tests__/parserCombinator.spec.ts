@@ -1,4 +1,4 @@
-import {Parser as P} from "../parserCombinator";
+import {Parser as P, ParsingState, PartialResult} from "../parserCombinator";
 
 
 describe("parserCombinator", () => {
@@ -11,6 +11,18 @@ describe("parserCombinator", () => {
     expect(parser.parse("45").type === "failure").toBeTrue
   });
 
+  test("EOF after partially consumed input", () => {
+    const parser = P.str("ab").skip(P.EOF);
+
+    expect(parser.parsePartial({offset: 0, input: "ab"})).toEqual([
+      {offset: 2, input: "ab"},
+      {type: "success", result: "ab"}
+    ])
+    expect(P.run(parser, "abc")).toEqual(
+      {type: "failure", expected: "EOF", got: "c...", offset: 2}
+    )
+  });
+
 
   test("basic str parser", () => {
     const parser = P.str("12");
@@ -30,6 +42,33 @@ describe("parserCombinator", () => {
 
   });
 
+  test("str and regex match at the current offset", () => {
+    const parser = P.sequence(P.str("ab"), P.regex(/\d+/), P.str("cd"));
+
+    expect(parser.parse("ab12cd")).toEqual({type: "success", result: ["ab", "12", "cd"]})
+    // the regex should not find a match further ahead in the input
+    expect(P.run(parser, "abx12cd")).toEqual(
+      {type: "failure", expected: "/\\d+/", got: "x12cd...", offset: 2}
+    )
+    expect(parser.parsePartial({offset: 3, input: "xyzab12cd"})).toEqual([
+      {offset: 9, input: "xyzab12cd"},
+      {type: "success", result: ["ab", "12", "cd"]}
+    ])
+  });
+
+  test("anchored regex after a prefix", () => {
+    const parser = P.sequence(P.str("ab"), P.regex(/^\d+/), P.regex(/^[^x]/))
+
+    expect(parser.parse("ab12c")).toEqual({type: "success", result: ["ab", "12", "c"]})
+    expect(P.compile(parser).parse("ab12c")).toEqual({type: "success", result: ["ab", "12", "c"]})
+    expect(P.run(parser, "abx")).toEqual(
+      {type: "failure", expected: "/^\\d+/", got: "x...", offset: 2}
+    )
+    // other anchors can't match relative to the offset
+    expect(() => P.regex(/a|^b/)).toThrow()
+    expect(P.regex(/[\^a]\^/).parse("^^")).toEqual({type: "success", result: "^^"})
+  });
+
   test("map", () => {
     const parser = P.regex(/\d{1,3}/).map((d) => +d);
 
@@ -68,6 +107,21 @@ describe("parserCombinator", () => {
 
   });
 
+  test("chains of skip, then and map", () => {
+    const parser = P.str("(")
+      .then(P.regex(/\d+/))
+      .skip(P.str(","))
+      .map((d) => +d)
+      .map((d) => d * 2)
+      .then(P.regex(/\d+/).map((d) => +d))
+      .skip(P.str(")"))
+
+    expect(parser.parse("(1,2)")).toEqual({type: "success", result: 2})
+    expect(P.run(parser, "(1,x)")).toEqual(
+      {type: "failure", expected: "/\\d+/", got: "x)...", offset: 3}
+    )
+  });
+
   test("sequence", () => {
     const parser = P.sequence(
       P.regex(/\d{1,3}/),
@@ -97,6 +151,105 @@ describe("parserCombinator", () => {
 
   });
 
+  test("alternatives with overlapping first characters", () => {
+    const parser = P.alternatives<string | number>(
+      P.str("ab"),
+      P.regex(/-?\d+/).map((d) => +d),
+      P.regex(/[a-c0-9-]+/),
+      P.str("").skip(P.str("-")),
+      P.str("x").optional().map((x) => x ?? "none"),
+      P.str("ac"),
+    )
+
+    expect(parser.parse("ab")).toEqual({type: "success", result: "ab"})
+    expect(parser.parse("ac")).toEqual({type: "success", result: "ac"})
+    expect(parser.parse("-12")).toEqual({type: "success", result: -12})
+    expect(parser.parse("-a")).toEqual({type: "success", result: "-a"})
+    expect(parser.parse("-")).toEqual({type: "success", result: "-"})
+    expect(parser.parse("x")).toEqual({type: "success", result: "x"})
+    expect(parser.parse("")).toEqual({type: "success", result: "none"})
+    expect(parser.parsePartial({offset: 0, input: "z"})[1]).toEqual({type: "success", result: "none"})
+
+    // the branches skipped by the dispatch are expected as well
+    expect(P.run(P.alternatives(P.str("a"), P.str("b")), "z")).toEqual(
+      {type: "failure", expected: "a, b", got: "z...", offset: 0}
+    )
+    expect(P.compile(P.alternatives(P.str("a"), P.str("b"))).parse("z")).toEqual(
+      {type: "failure", expected: "a, b", got: "z...", offset: 0}
+    )
+    const nested = P.alternatives(P.sequence(P.str("x").optional(), P.str("y")), P.str("a").desc("an a"), P.regex(/\d+/))
+    expect(nested.parse("z")).toEqual(
+      {type: "failure", expected: "x, y, an a, /\\d+/", got: "z...", offset: 0}
+    )
+    expect(P.compile(nested).parse("z")).toEqual(nested.parse("z"))
+  });
+
+  test("failure of custom parsers", () => {
+    const vowel = new class extends P<string> {
+      readonly expected = P.expectation("a vowel")
+
+      parsePartial = (state: ParsingState): [ParsingState, PartialResult<string>] => {
+        const c = state.input.charAt(state.offset)
+        if (c !== "" && "aeiou".includes(c)) {
+          return [{...state, offset: state.offset + 1}, {type: "success", result: c}]
+        }
+        return P.failure(state, this.expected)
+      }
+    }()
+
+    expect(vowel.parse("e")).toEqual({type: "success", result: "e"})
+    expect(P.alternatives(vowel, P.str("x")).parse("z")).toEqual(
+      {type: "failure", expected: "a vowel, x", got: "z...", offset: 0}
+    )
+    expect(P.sequence(vowel, vowel).parse("ab")).toEqual(
+      {type: "failure", expected: "a vowel", got: "b...", offset: 1}
+    )
+    expect(P.compile(P.sequence(vowel, vowel)).parse("ab")).toEqual(
+      {type: "failure", expected: "a vowel", got: "b...", offset: 1}
+    )
+  });
+
+  test("expectations of many distinct parsers", () => {
+    const grammar = P.str("a")
+    for (let i = 0; i < 70000; i++) {
+      P.str(`expected${i}`)
+    }
+
+    expect(grammar.parse("b")).toEqual({type: "failure", expected: "a", got: "b...", offset: 0})
+    expect(P.str("last").parse("b")).toEqual({type: "failure", expected: "last", got: "b...", offset: 0})
+  });
+
+  test("keywords", () => {
+    const parser = P.keywords({"in": 1, "int": 2, "integer": 3, "i": 4})
+
+    expect(parser.parse("i")).toEqual({type: "success", result: 4})
+    expect(parser.parse("in")).toEqual({type: "success", result: 1})
+    expect(parser.parse("int")).toEqual({type: "success", result: 2})
+    expect(parser.parse("integer")).toEqual({type: "success", result: 3})
+    expect(parser.parse("inte")).toEqual({type: "failure", expected: "EOF", got: "e...", offset: 3})
+    expect(parser.parsePartial({offset: 0, input: "integ"})).toEqual([
+      {offset: 3, input: "integ"},
+      {type: "success", result: 2}
+    ])
+    expect(P.run(parser, "yz")).toEqual(
+      {type: "failure", expected: "in | int | integer | i", got: "yz...", offset: 0}
+    )
+
+    const shortest = P.keywords({"in": 1, "int": 2}, {longest: false})
+    expect(shortest.parsePartial({offset: 0, input: "int"})).toEqual([
+      {offset: 2, input: "int"},
+      {type: "success", result: 1}
+    ])
+
+    const many: Record<string, number> = {}
+    for (let i = 0; i < 20000; i++) {
+      many[`keyword${i}`] = i
+    }
+    const manyParser = P.keywords(many)
+    expect(manyParser.parse("keyword12345")).toEqual({type: "success", result: 12345})
+    expect(P.compile(manyParser).parse("keyword19999")).toEqual({type: "success", result: 19999})
+  });
+
 test("surroundedBy and describe", () => {
     const parser = P.regex(/\w+/).surroundedBy("{", "}").desc("list_var")
 
@@ -104,6 +257,27 @@ test("surroundedBy and describe", () => {
     expect(r1.type === "failure" && r1.expected === "list_var").toBeTrue
 
     expect(parser.parse("{my_list}")).toEqual({type: "success", result: "my_list"})
+
+    // once input was consumed, the failure inside the described parser is reported
+    expect(parser.parse("{my_list")).toEqual({type: "failure", expected: "}", got: "...", offset: 8})
+  });
+
+  test("failures report everything expected at the furthest offset", () => {
+    const parser = P.alternatives(
+      P.str("a").then(P.str("b")),
+      P.str("a").then(P.regex(/\d/)),
+      P.str("c"),
+    ).skip(P.str(";"))
+
+    expect(parser.parse("ax")).toEqual({type: "failure", expected: "b, /\\d/", got: "x...", offset: 1})
+    expect(P.compile(parser).parse("ax")).toEqual(parser.parse("ax"))
+    expect(parser.parse("c")).toEqual({type: "failure", expected: ";", got: "...", offset: 1})
+    expect(parser.parse("a1;x")).toEqual({type: "failure", expected: "EOF", got: "x...", offset: 3})
+
+    // failures at the same offset are merged with the described name replacing them
+    const described = P.str("ab").desc("ab_name").or(P.str("ac").desc("ac_name"))
+    expect(described.parse("ad")).toEqual({type: "failure", expected: "ab_name, ac_name", got: "ad...", offset: 0})
+    expect(P.compile(described).parse("ad")).toEqual(described.parse("ad"))
   });
 
   test("repeat", () => {
@@ -217,7 +391,7 @@ test("surroundedBy and describe", () => {
     // make sure times doesn't fail if it passes max and that it correctly stops 
     // successfully after the max values are parsed
     expect(parser.parsePartial({offset: 0, input: "aaa"})).toEqual([
-      {offset: 2, input: "a"},
+      {offset: 2, input: "aaa"},
       {type: "success", result: ["a","a"]}
     ])
 
@@ -237,6 +411,108 @@ test("surroundedBy and describe", () => {
     expect(parser.parse("a,a,a,a,a").type === "failure").toBeTrue
   });
 
+  test("quantifiers collect values into a fresh array on every parse", () => {
+    const parser = P.str("a").zeroOrMoreTimes({delimiter: ","})
+
+    const r1 = parser.parse("a,a")
+    const r2 = parser.parse("a,a,a")
+    expect(r1).toEqual({type: "success", result: ["a", "a"]})
+    expect(r2).toEqual({type: "success", result: ["a", "a", "a"]})
+
+    const input = Array(10000).fill("a").join(",")
+    const r3 = parser.parse(input)
+    expect(r3.type === "success" && r3.result.length).toEqual(10000)
+  });
+
+  test("many and sepBy", () => {
+    const a = P.str("a")
+    const delimiter = P.str(",")
+
+    expect(a.many().parse("")).toEqual({type: "success", result: []})
+    expect(a.many().parse("aaa")).toEqual({type: "success", result: ["a", "a", "a"]})
+    expect(a.many1().parse("")).toEqual({type: "failure", expected: "a", got: "...", offset: 0})
+    expect(a.sepBy(delimiter).parse("")).toEqual({type: "success", result: []})
+    expect(a.sepBy(delimiter).parse("a,a")).toEqual({type: "success", result: ["a", "a"]})
+    expect(a.sepBy1(delimiter).parse("")).toEqual({type: "failure", expected: "a", got: "...", offset: 0})
+
+    // a trailing delimiter is left for the following parser
+    const trailing = P.product(a.sepBy1(delimiter), delimiter.optional())
+    expect(trailing.parse("a,a,")).toEqual({type: "success", result: [["a", "a"], ","]})
+
+    for (const input of ["", "a", "a,a", "a,a,", ",a", "a,b"]) {
+      expect(P.compile(trailing).parse(input)).toEqual(trailing.parse(input))
+      expect(P.compile(a.sepBy(delimiter)).parse(input)).toEqual(a.sepBy(delimiter).parse(input))
+    }
+  });
+
+  test("memo", () => {
+    let invocations = 0
+    const digits = P.regex(/\d+/).map((d) => {
+      invocations++
+      return d
+    })
+
+    const parser = (p: P<string>) => P.alternatives(
+      p.skip(P.str("a")),
+      p.skip(P.str("b")),
+      p.skip(P.str("c")),
+    )
+
+    expect(parser(digits).parse("123c")).toEqual({type: "success", result: "123"})
+    expect(invocations).toEqual(3)
+
+    invocations = 0
+    const memoized = parser(digits.memo())
+    expect(memoized.parse("123c")).toEqual({type: "success", result: "123"})
+    expect(invocations).toEqual(1)
+
+    // the memo table is not shared between parses
+    expect(memoized.parse("45b")).toEqual({type: "success", result: "45"})
+    expect(invocations).toEqual(2)
+    expect(memoized.parse("x")).toEqual({type: "failure", expected: "/\\d+/", got: "x...", offset: 0})
+    // failures after a memoized result report every alternative
+    expect(memoized.parse("12x")).toEqual({type: "failure", expected: "a, b, c", got: "x...", offset: 2})
+
+    // the compiled parser memoizes as well
+    const compiled = P.compile(memoized)
+    invocations = 0
+    expect(compiled.parse("123c")).toEqual({type: "success", result: "123"})
+    expect(invocations).toEqual(1)
+    expect(compiled.parse("12x")).toEqual(memoized.parse("12x"))
+    expect(compiled.parse("x")).toEqual(memoized.parse("x"))
+  });
+
+  test("compile", () => {
+    const number = P.regex(/\d+/).map((d) => +d)
+    const parser = P.sequence(
+      P.str("let"),
+      P.regex(/\s+/).then(P.regex(/[a-z]+/)).desc("name"),
+      P.str("=").surroundedBy(" ").optional(),
+      number.oneOrMoreTimes({delimiter: ","}),
+      // bind can't be compiled, so it's called through the interpreted parser
+      number.bind((n) => P.str("!").repeat(n)).recoverWith([]),
+    )
+    const compiled = P.compile(parser)
+
+    for (const input of ["let x = 1,2,3", "let x1", "let x 1,2", "let x = 1,22", "let x = 1,2", "let x = 13!!!", "let x = 1,2!!"]) {
+      expect(compiled.parse(input)).toEqual(parser.parse(input))
+      expect(compiled.parsePartial({offset: 0, input})).toEqual(parser.parsePartial({offset: 0, input}))
+    }
+  });
+
+  test("compile literals outside the BMP", () => {
+    // astral characters are two UTF-16 units, both must be checked
+    for (const literal of ["😀", "a😀b"]) {
+      const parser = P.str(literal)
+      const compiled = P.compile(parser)
+      for (const input of ["😀", "😁", "a😀b", "a😀c", "a😁b", ""]) {
+        expect(compiled.parse(input)).toEqual(parser.parse(input))
+      }
+    }
+    expect(P.compile(P.str("😀")).parse("😁").type).toEqual("failure")
+    expect(P.compile(P.str("a😀b")).parse("a😀c").type).toEqual("failure")
+  });
+
   test("oneOrMoreTimes with delimiterParser", () => {
     const parser = P.str("a").oneOrMoreTimes({delimiterParser: P.regex(/\s+/).optional()})
 
@@ -259,5 +535,30 @@ test("surroundedBy and describe", () => {
     expect(parser.parse("aaaaa")).toEqual({type: "success", result: ["a", "a", "a", "a" ,"a"]})
   });
 
+
+  test("profile", () => {
+    const item = P.regex(/\d+/).desc("number").or(P.str("x"))
+    const parser = item.oneOrMoreTimes({delimiter: ","})
+    const parsePartial = item.parsePartial
+
+    const report = P.profile(parser, ["1,x,23", "1,y"])
+    const counts = (label: string) => {
+      const e = report.find((e) => e.label === label)
+      return e && [e.invocations, e.successes, e.failures, e.backtracks]
+    }
+
+    // the number branch is never tried on letters, since they can't start a number
+    expect(counts("number")).toEqual([3, 3, 0, 0])
+    expect(counts('"x"')).toEqual([2, 1, 1, 0])
+    expect(counts("EOF")).toEqual([2, 1, 1, 0])
+    expect(counts('","')).toEqual([4, 3, 1, 0])
+    expect(counts('sepBy(alt(number | "x"), ",", 1)')).toEqual([2, 2, 0, 0])
+    expect(report.every((e, i) => i === 0 || report[i - 1].selfTime >= e.selfTime)).toBe(true)
+    expect(report.every((e) => e.totalTime >= e.selfTime)).toBe(true)
+
+    // the parsers are restored once profiling ends
+    expect(item.parsePartial).toBe(parsePartial)
+    expect(parser.parse("1,x,23")).toEqual({type: "success", result: ["1", "x", "23"]})
+  });
 });
  
\ No newline at end of file
@@ -0,0 +1,72 @@
+import {
+  decodeSpikeQueries, decodeSpikeQuery, encodeSpikeQueries, encodeSpikeQuery, SpikeQueryReader, termTags,
+} from "../spikeEncoding";
+import { parseStructuralQuery, SpikeQuery } from "../spikeQuery";
+
+const parse = (query: string): SpikeQuery => {
+  const r = parseStructuralQuery(query)
+  if (r.type === "failure") {
+    throw new Error(`failed to parse ${query}`)
+  }
+  return r.result
+}
+
+const queries = [
+  "",
+  "abc and def",
+  "$[e=LOC|CITY]founded `New York` it's",
+  "<E>cap_1:[w=foo&l={list}|`two words`&tag]bar :x ?",
+  "`héllo wörld` 日本 $[w=`日本`]x",
+].map(parse)
+
+describe("spikeEncoding", () => {
+  test("decoding results in the encoded queries", () => {
+    queries.forEach((query) => {
+      expect(decodeSpikeQuery(encodeSpikeQuery(query))).toEqual(query)
+    })
+    expect(decodeSpikeQueries(encodeSpikeQueries(queries))).toEqual(queries)
+
+    // many strings to need multi byte varints
+    const long = parse(Array.from({ length: 1000 }, (_, i) => `$[w=v${i}]w${i}`).join(" "))
+    expect(decodeSpikeQuery(encodeSpikeQuery(long))).toEqual(long)
+  });
+
+  test("strings are stored once", () => {
+    const repeated = Array(100).fill(queries[2])
+    const encoded = encodeSpikeQueries(repeated)
+
+    expect(encoded.length < JSON.stringify(repeated).length / 10).toBe(true)
+    expect(decodeSpikeQueries(encoded)).toEqual(repeated)
+  });
+
+  test("reading without decoding", () => {
+    const reader = new SpikeQueryReader(encodeSpikeQueries(queries))
+    expect(reader.queryCount).toBe(5)
+
+    reader.open(3)
+    expect(reader.termCount).toBe(3)
+    expect(reader.nextTerm()).toBe(true)
+    expect(reader.termTag).toBe(termTags.capture)
+    expect(reader.string(reader.nameIndex)).toBe("cap_1")
+    expect(reader.string(reader.expandIndex)).toBe("E")
+    expect(reader.constraintCount).toBe(3)
+
+    // the rest of the term is skipped
+    expect(reader.nextConstraint()).toBe(true)
+    expect(reader.nextTerm()).toBe(true)
+    expect(reader.string(reader.wordIndex)).toBe("x")
+    expect(reader.nameIndex).toBe(-1)
+    expect(reader.nextTerm()).toBe(true)
+    expect(reader.termTag).toBe(termTags.token)
+    expect(reader.nextTerm()).toBe(false)
+
+    reader.open(2)
+    reader.nextTerm()
+    reader.nextConstraint()
+    const values = []
+    while (reader.nextAlternative()) {
+      values.push(reader.string(reader.valueIndex))
+    }
+    expect(values).toEqual(["LOC", "CITY"])
+  });
+});
@@ -0,0 +1,87 @@
+import * as fs from "fs";
+import * as os from "os";
+import * as path from "path";
+import {
+  candidateSentences, intersectPostings, searchIndex, SentenceIndex, SentenceIndexBuilder,
+} from "../spikeIndex";
+import { encodeSentence, TokenizedSentence, Vocabulary } from "../spikeMatcher";
+import { parseStructuralQuery, SpikeQuery } from "../spikeQuery";
+import { seededRandomInt } from "../__benchmarks__/utils";
+
+const parse = (query: string): SpikeQuery => {
+  const r = parseStructuralQuery(query)
+  if (r.type === "failure") {
+    throw new Error(`failed to parse ${query}`)
+  }
+  return r.result
+}
+
+describe("sentence index", () => {
+  const vocabulary = new Vocabulary()
+  const token = (word: string, entity = "O") => ({ word, lemma: word.toLowerCase(), tag: "NN", entity })
+  const sentences: Array<TokenizedSentence> = [
+    [token("Paris", "CITY"), token("was"), token("founded")],
+    [token("Rome", "CITY"), token("was"), token("built")],
+    [token("Google"), token("was"), token("founded"), token("in"), token("California", "STATE")],
+    [token("nothing"), token("here")],
+  ].map((tokens) => encodeSentence(vocabulary, tokens))
+
+  const builder = new SentenceIndexBuilder()
+  sentences.forEach((sentence) => builder.add(sentence))
+  const index = builder.build()
+  const opts = { vocabulary, lists: { places: ["CITY", "STATE"] } }
+
+  test("intersecting posting lists", () => {
+    const randomInt = seededRandomInt(15)
+    const random = (size: number, max: number) => Int32Array.from(
+      new Set(Array.from({ length: size }, () => randomInt(max))),
+    ).sort()
+    for (let i = 0; i < 100; i++) {
+      const a = random(randomInt(50), 1000)
+      const b = random(randomInt(500), 1000)
+      const expected = Array.from(a).filter((x) => b.includes(x))
+      expect(Array.from(intersectPostings(a, b))).toEqual(expected)
+      expect(Array.from(intersectPostings(b, a))).toEqual(expected)
+    }
+  });
+
+  test("candidates and matches", () => {
+    const candidates = (query: string) => Array.from(candidateSentences(index, parse(query), opts) ?? [])
+
+    expect(candidates("was founded")).toEqual([0, 2])
+    expect(candidates(":[e={places}]x was")).toEqual([0, 1, 2])
+    expect(candidates("was destroyed")).toEqual([])
+    expect(candidateSentences(index, parse(":[t]x"), opts)).toBe(undefined)
+
+    const search = (query: string) => Array.from(searchIndex(index, parse(query), opts, (id) => sentences[id]))
+    expect(search(":[e={places}]x was")).toEqual([{ sentence: 0, start: 0 }, { sentence: 1, start: 0 }])
+    expect(search("$[l=was]x")).toEqual([0, 1, 2].map((sentence) => ({ sentence, start: 1 })))
+  });
+
+  test("save and load", () => {
+    const file = path.join(fs.mkdtempSync(path.join(os.tmpdir(), "spike-index-")), "index.bin")
+    index.save(file)
+    const loaded = SentenceIndex.load(file)
+
+    expect(loaded.sentenceCount).toBe(4)
+    const founded = vocabulary.id("founded") as number
+    expect(Array.from(loaded.postings(0, founded))).toEqual([0, 2])
+    expect(Array.from(candidateSentences(loaded, parse(":[e={places}]x"), opts) ?? [])).toEqual([0, 1, 2])
+
+    // truncated or corrupt files are rejected
+    const bytes = fs.readFileSync(file)
+    const corrupt = path.join(path.dirname(file), "corrupt.bin")
+    const loadCorrupt = (data: Uint8Array) => {
+      fs.writeFileSync(corrupt, data)
+      return () => SentenceIndex.load(corrupt)
+    }
+    expect(loadCorrupt(bytes.subarray(0, bytes.length - 4))).toThrow()
+    expect(loadCorrupt(bytes.subarray(0, bytes.length - 2))).toThrow()
+    expect(loadCorrupt(bytes.subarray(0, 8))).toThrow()
+    const wrongKeyCount = new Uint8Array(bytes)
+    new Int32Array(wrongKeyCount.buffer)[3] += 1
+    expect(loadCorrupt(wrongKeyCount)).toThrow()
+    expect(loadCorrupt(bytes)).not.toThrow()
+    fs.rmSync(path.dirname(file), { recursive: true })
+  });
+});
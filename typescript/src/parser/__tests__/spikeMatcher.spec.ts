@@ -0,0 +1,51 @@
+import { compileSpikeQuery, encodeSentence, Vocabulary } from "../spikeMatcher";
+import { parseStructuralQuery, SpikeQuery } from "../spikeQuery";
+
+const parse = (query: string): SpikeQuery => {
+  const r = parseStructuralQuery(query)
+  if (r.type === "failure") {
+    throw new Error(`failed to parse ${query}`)
+  }
+  return r.result
+}
+
+describe("compileSpikeQuery", () => {
+  const vocabulary = new Vocabulary()
+  const sentence = encodeSentence(vocabulary, [
+    { word: "Paris", lemma: "paris", tag: "NNP", entity: "CITY" },
+    { word: "was", lemma: "be", tag: "VBD", entity: "O" },
+    { word: "founded", lemma: "found", tag: "VBN", entity: "O" },
+    { word: "by", lemma: "by", tag: "IN", entity: "O" },
+    { word: "the", lemma: "the", tag: "DT", entity: "O" },
+    { word: "Parisii", lemma: "parisii", tag: "NNPS", entity: "ORG" },
+  ])
+  const lists = { places: ["LOC", "CITY", "COUNTRY"] }
+
+  test("tokens match consecutive words", () => {
+    const matcher = compileSpikeQuery(parse("was founded"), { vocabulary })
+
+    expect(matcher.length).toBe(2)
+    expect(matcher.find(sentence)).toBe(1)
+    expect(matcher.matchAt(sentence, 0)).toBe(false)
+    expect(matcher.find(sentence, 2)).toBe(-1)
+    expect(compileSpikeQuery(parse("founded was"), { vocabulary }).find(sentence)).toBe(-1)
+  });
+
+  test("constraints and lists", () => {
+    const matcher = compileSpikeQuery(parse("city:[e={places}&t=NNP]London $[l=be]is founded"), { vocabulary, lists })
+
+    expect(matcher.find(sentence)).toBe(0)
+    expect(matcher.captures).toEqual([{ name: "city", term: 0 }])
+    expect(compileSpikeQuery(parse(":[e={places}|ORG]x"), { vocabulary, lists }).find(sentence, 1)).toBe(5)
+    expect(compileSpikeQuery(parse(":[e=LOC]x"), { vocabulary, lists }).find(sentence)).toBe(-1)
+    expect(compileSpikeQuery(parse("by :[w]the"), { vocabulary }).find(sentence)).toBe(3)
+  });
+
+  test("implicit values and unknown lists", () => {
+    const implicitValue = (_: string, word: string) => word.toLowerCase()
+    expect(compileSpikeQuery(parse(":[l]Found"), { vocabulary, implicitValue }).find(sentence)).toBe(2)
+
+    expect(() => compileSpikeQuery(parse(":[l]Found"), { vocabulary })).toThrow()
+    expect(() => compileSpikeQuery(parse(":[e={people}]x"), { vocabulary, lists })).toThrow()
+  });
+});
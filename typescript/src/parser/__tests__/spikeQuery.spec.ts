@@ -1,6 +1,18 @@
-import {parseStructuralQuery} from "../spikeQuery";
+import {
+  createCachedQueryParser,
+  createIncrementalQueryParser,
+  parseStructuralQuery as parseStructuralQueryWithMode,
+  parseStructuralQueryWithRecovery,
+  profileStructuralQueries,
+} from "../spikeQuery";
+import {seededRandomInt} from "../__benchmarks__/utils";
+
+describe.each([
+  ["interpreted", false],
+  ["compiled", true],
+])("parseStructuralQuery (%s)", (_, compiled) => {
+  const parseStructuralQuery = (query: string) => parseStructuralQueryWithMode(query, { compiled });
 
-describe("parseStructuralQuery", () => {
   test("only tokens", () => {
     const query = "abc and def"
     expect(parseStructuralQuery(query)).toEqual({
@@ -355,4 +367,142 @@ test("complex capture", () => {
     expect(p.type == "failure" && p.offset === 6).toBeTrue
   });
 
-});
\ No newline at end of file
+});
+
+describe("compiled parseStructuralQuery", () => {
+  test.each([
+    "abc U2>cap_1:[w&e=PERSON|{my_list}|`some long value`]and def",
+    "abc $[e=]and",
+    "abc $[x=LOC]and",
+    "abc :[w=`unterminated]and",
+    "abc <U1>",
+  ])("fails the same way as the interpreted parser on %s", (query) => {
+    expect(parseStructuralQueryWithMode(query, { compiled: true })).toEqual(parseStructuralQueryWithMode(query))
+  });
+});
+
+describe("createCachedQueryParser", () => {
+  test("caches frozen results with LRU eviction", () => {
+    const parser = createCachedQueryParser({ capacity: 2 })
+
+    const r1 = parser.parse("abc $[e=LOC]and")
+    expect(r1).toEqual(parseStructuralQueryWithMode("abc $[e=LOC]and"))
+    expect(Object.isFrozen(r1)).toBe(true)
+    expect(r1.type === "success" && Object.isFrozen(r1.result.terms[1])).toBe(true)
+    expect(parser.parse("abc $[e=LOC]and")).toBe(r1)
+    expect(parser.stats).toEqual({ hits: 1, misses: 1, evictions: 0, size: 1 })
+
+    const r2 = parser.parse("U2>cap")
+    expect(r2.type).toEqual("failure")
+    expect(parser.parse("abc $[e=LOC]and")).toBe(r1)
+
+    // evicts the least recently used query (U2>cap)
+    parser.parse("def")
+    expect(parser.stats).toEqual({ hits: 2, misses: 3, evictions: 1, size: 2 })
+    expect(parser.parse("abc $[e=LOC]and")).toBe(r1)
+    expect(parser.parse("U2>cap")).not.toBe(r2)
+    expect(parser.stats).toEqual({ hits: 3, misses: 4, evictions: 2, size: 2 })
+  });
+
+  test("doesn't freeze results parsed without the cache", () => {
+    for (const compiled of [false, true]) {
+      const parser = createCachedQueryParser({ compiled })
+      const cached = parser.parse("$abc :def")
+      expect(cached.type === "success" && Object.isFrozen(cached.result.terms[0])).toBe(true)
+
+      const uncached = parseStructuralQueryWithMode("$abc :def", { compiled })
+      if (uncached.type !== "success") {
+        throw new Error("expected the query to parse")
+      }
+      for (const term of uncached.result.terms) {
+        expect(Object.isFrozen(term)).toBe(false)
+        if (term.type !== "token") {
+          expect(Object.isFrozen(term.constraints)).toBe(false)
+          term.constraints.push({ type: "tag", alternatives: [] })
+          expect(term.constraints.length).toEqual(1)
+        }
+      }
+    }
+  });
+});
+
+describe("createIncrementalQueryParser", () => {
+  test("edits", () => {
+    const parser = createIncrementalQueryParser()
+    parser.parse("abc $[e=LOC]and def")
+
+    // extending a term
+    expect(parser.edit(3, 0, "d")).toEqual(parseStructuralQueryWithMode("abcd $[e=LOC]and def"))
+    // turning a term into a capture
+    expect(parser.edit(5, 1, ":")).toEqual(parseStructuralQueryWithMode("abcd :[e=LOC]and def"))
+    // a failure, and recovering from it
+    expect(parser.edit(0, 0, "<")).toEqual(parseStructuralQueryWithMode("<abcd :[e=LOC]and def"))
+    expect(parser.edit(0, 1, "")).toEqual(parseStructuralQueryWithMode("abcd :[e=LOC]and def"))
+    // a capture name that spans several terms
+    parser.parse("ab_c_d_e x")
+    expect(parser.edit(8, 1, ":")).toEqual(parseStructuralQueryWithMode("ab_c_d_e:x"))
+    // closing a backtick quoted value
+    parser.parse("`abc def ghi")
+    expect(parser.edit(12, 0, "`")).toEqual(parseStructuralQueryWithMode("`abc def ghi`"))
+    expect(parser.text).toEqual("`abc def ghi`")
+    // closing a value opened by an earlier edit, before the terms that were reused
+    parser.parse("x abc def")
+    expect(parser.edit(0, 0, "`")).toEqual(parseStructuralQueryWithMode("`x abc def"))
+    expect(parser.edit(10, 0, "`")).toEqual(parseStructuralQueryWithMode("`x abc def`"))
+  });
+
+  test("random edits give the same result as parsing the whole query", () => {
+    const pieces = ["abc", " ", "  ", "$", ":", "[", "]", "e=LOC", "|", "&", "w", "`", "<U1>", "cap_1", "42", ".5", "?", "x"]
+    const random = seededRandomInt(42)
+
+    const parser = createIncrementalQueryParser()
+    let text = "abc $[e=LOC|CITY&w={names}]and <U1>cap_1:[w=`a b`]def ? 42"
+    parser.parse(text)
+    for (let i = 0; i < 2000; i++) {
+      const start = random(text.length + 1)
+      const deleteCount = random(Math.min(4, text.length - start) + 1)
+      const insertText = random(3) === 0 ? "" : pieces[random(pieces.length)]
+      text = text.substring(0, start) + insertText + text.substring(start + deleteCount)
+
+      expect(parser.edit(start, deleteCount, insertText)).toEqual(parseStructuralQueryWithMode(text))
+      if (text.length > 80) {
+        text = "abc $[e=LOC]and <U1>cap_1:def"
+        parser.parse(text)
+      }
+    }
+  });
+});
+
+describe("profileStructuralQueries", () => {
+  test("reports the grammar by desc names", () => {
+    const report = profileStructuralQueries(["abc $[w=x]y", "a:b"])
+    const searchTerm = report.find((e) => e.label === "search term")
+
+    expect(searchTerm && [searchTerm.invocations, searchTerm.successes]).toEqual([5, 3])
+  });
+});
+
+describe("parseStructuralQueryWithRecovery", () => {
+  test("reports every bad term and keeps the rest", () => {
+    const { terms, diagnostics } = parseStructuralQueryWithRecovery("abc $[w=x def >bad ghi ]")
+
+    expect(terms.map((t) => t.word)).toEqual(["abc", "def", "ghi"])
+    expect(diagnostics.map(({ start, end }) => [start, end])).toEqual([[4, 9], [14, 18], [23, 24]])
+    expect(diagnostics[1].expected).toBe("search term")
+  });
+
+  test("same terms as parseStructuralQuery without diagnostics", () => {
+    const alphabet = ["a", "b", " ", "$", ":", "[", "]", "w", "=", "|", "&", "`", "<", ">", "{", "}", "'s"]
+    const random = seededRandomInt(7)
+    for (let i = 0; i < 2000; i++) {
+      const query = Array.from({ length: random(12) }, () => alphabet[random(alphabet.length)]).join("")
+      const parsed = parseStructuralQueryWithMode(query)
+      const recovered = parseStructuralQueryWithRecovery(query)
+
+      expect(recovered.diagnostics.length === 0).toBe(parsed.type === "success")
+      if (parsed.type === "success") {
+        expect(recovered.terms).toEqual(parsed.result.terms)
+      }
+    }
+  });
+});
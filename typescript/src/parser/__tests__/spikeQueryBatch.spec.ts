@@ -0,0 +1,52 @@
+import {parseStructuralQuery} from "../spikeQuery";
+import {parseStructuralQueries, parseStructuralQueryStream} from "../spikeQueryBatch";
+
+describe("parseStructuralQueries", () => {
+  const queries = ["abc", "$[e=LOC]and", "U2>cap", "abc", ":def", "abc $[e=LOC]and"]
+
+  test("results are in the order of the input queries", async () => {
+    const results = await parseStructuralQueries(queries, { batchSize: 2 })
+
+    expect(results).toEqual(queries.map((query) => parseStructuralQuery(query)))
+    // identical queries are parsed once
+    expect(results[0]).toBe(results[3])
+  });
+
+  // from the typescript sources the workers are compiled with ts-node, see spawnQueryWorker
+  const workersAvailable = __filename.endsWith(".js") || (() => {
+    try {
+      require.resolve("ts-node/register")
+      return true
+    } catch {
+      return false
+    }
+  })()
+  const testWorkers = workersAvailable ? test : test.skip
+
+  testWorkers("parsing in workers", async () => {
+    const results = await parseStructuralQueries(queries, { workers: 2, batchSize: 2, compiled: true })
+
+    expect(results).toEqual(queries.map((query) => parseStructuralQuery(query)))
+    expect(results[0]).toBe(results[3])
+  });
+
+  test("empty input", async () => {
+    expect(await parseStructuralQueries([])).toEqual([])
+    expect(await parseStructuralQueries([], { workers: 2 })).toEqual([])
+  });
+});
+
+describe("parseStructuralQueryStream", () => {
+  test("parses every line of the stream", async () => {
+    async function* chunks() {
+      yield "abc $[e=LO"
+      yield "C]and\n:def\n"
+    }
+    const results = []
+    for await (const result of parseStructuralQueryStream(chunks())) {
+      results.push(result)
+    }
+
+    expect(results).toEqual([parseStructuralQuery("abc $[e=LOC]and"), parseStructuralQuery(":def")])
+  });
+});
@@ -0,0 +1,63 @@
+import {Parser as P} from "../parserCombinator";
+import {ChunkRope, parseStream} from "../streaming";
+
+async function* chunks<A>(...items: Array<A>): AsyncGenerator<A> {
+  for (const item of items) {
+    yield item
+  }
+}
+
+async function collect<A>(generator: AsyncGenerator<A>): Promise<Array<A>> {
+  const results = []
+  for await (const item of generator) {
+    results.push(item)
+  }
+  return results
+}
+
+describe("streaming", () => {
+
+  test("ChunkRope", () => {
+    const rope = new ChunkRope()
+    rope.append("ab")
+    rope.append("")
+    rope.append("c\nd")
+    rope.append("ef\n")
+
+    expect(rope.length).toEqual(8)
+    expect(rope.indexOf("\n")).toEqual(3)
+    expect(rope.indexOf("\n", 4)).toEqual(7)
+    expect(rope.indexOf("x")).toEqual(-1)
+    expect(rope.take(1)).toEqual("a")
+    expect(rope.indexOf("\n")).toEqual(2)
+    expect(rope.take(3)).toEqual("bc\n")
+    expect(rope.indexOf("e")).toEqual(1)
+    expect(rope.take(10)).toEqual("def\n")
+    expect(rope.length).toEqual(0)
+  });
+
+  test("parseStream with string chunks", async () => {
+    const parser = P.regex(/\d+/).map((d) => +d).oneOrMoreTimes({delimiter: ","})
+    const results = await collect(parseStream(parser, chunks("1,2", "\n3\r\n\n", "4,", "5,6\nx\n7")))
+
+    expect(results).toEqual([
+      {type: "success", result: [1, 2]},
+      {type: "success", result: [3]},
+      {type: "success", result: [4, 5, 6]},
+      {type: "failure", expected: "/\\d+/", got: "x...", offset: 0},
+      {type: "success", result: [7]},
+    ])
+  });
+
+  test("parseStream with byte chunks", async () => {
+    const bytes = new TextEncoder().encode("°a\nb°\n")
+    // split in the middle of the two bytes of the first °
+    const results = await collect(parseStream(P.regex(/[a-z°]+/), chunks(bytes.slice(0, 1), bytes.slice(1))))
+
+    expect(results).toEqual([
+      {type: "success", result: "°a"},
+      {type: "success", result: "b°"},
+    ])
+  });
+
+});
@@ -1,12 +1,22 @@
 /* eslint-disable @typescript-eslint/no-this-alias */
+import { LRUCache } from "./utils";
 
-import {
-  curried2, flipped2, reduce,
-} from "./utils";
-
-interface ParsingState {
+// the entire input is shared between all the states of a single parse,
+// parsers only move the offset forward as they consume the input
+export interface ParsingState {
   input: string;
   offset: number;
+  context?: ParsingContext;
+}
+
+// mutable context shared by all the states of a single parse, it's created by parse
+// and released with the states once the parse ends
+export interface ParsingContext {
+  // results of memoized parsers, by memo id and then by offset
+  memo: Map<number, Map<number, [ParsingState, PartialResult<unknown>]>>;
+  // the furthest offset any parser failed at, and the ids of what was expected there
+  furthest: number;
+  expected: Array<number>;
 }
 
 export interface Success<A> {
@@ -23,6 +33,116 @@ export interface Failure {
 
 export type ParsingResult<A> = Success<A> | Failure;
 
+// Most failures are discarded by alternatives and optional parsers, so while parsing a
+// failure only carries the id of what was expected. The human readable Failure is built
+// once the parse ends, from the expectations recorded at the furthest failing offset.
+export interface PartialFailure {
+  type: "failure";
+  expected: number;
+  offset: number;
+}
+
+export type PartialResult<A> = Success<A> | PartialFailure;
+
+// A sticky regex only matches exactly at lastIndex, so we can match against the shared
+// input without slicing it, and a failed match never scans ahead for a later occurrence.
+// Compiled regexes are cached per source and flags, so identical patterns used across a
+// grammar share a single instance (safe since lastIndex is always set right before exec).
+// The cache is bounded since regexes may also be built while parsing (e.g. in bind).
+// Since the regex sees the whole input, lookbehinds and \b also see the input before the
+// offset, and a ^ anchor would only match at the start of the input. A leading ^ is
+// dropped, since the sticky regex is already anchored at the offset, anywhere else it's
+// rejected as it can't be expressed relative to the offset.
+const stickyRegexCache = new LRUCache<string, RegExp>(1000);
+
+// the positions of the ^ anchors in the regex source, skipping escapes and character classes
+function anchorPositions(source: string): Array<number> {
+  const positions: Array<number> = [];
+  let inClass = false;
+  for (let i = 0; i < source.length; i++) {
+    const c = source[i];
+    if (c === "\\") {
+      i += 1;
+    } else if (inClass) {
+      inClass = c !== "]";
+    } else if (c === "[") {
+      inClass = true;
+    } else if (c === "^") {
+      positions.push(i);
+    }
+  }
+  return positions;
+}
+
+function stickyRegex(r: RegExp): RegExp {
+  const anchors = anchorPositions(r.source);
+  const source = anchors[0] === 0 ? r.source.substring(1) : r.source;
+  if (anchors.some((position) => position > 0)) {
+    throw new Error(`Parser.regex only supports a leading ^ anchor, got ${r}`);
+  }
+
+  const flags = r.flags.includes("y") ? r.flags : `${r.flags}y`;
+  const key = `${flags}/${source}`;
+  let sticky = stickyRegexCache.get(key);
+  if (sticky === undefined) {
+    sticky = new RegExp(source, flags);
+    stickyRegexCache.set(key, sticky);
+  }
+  return sticky;
+}
+
+// Expectations are interned when parsers are built, so failing doesn't need to build strings.
+// Parsers can also be built while parsing (e.g. in bind) with expectations depending on the
+// parsed values, so the table is bounded: past maxExpectations, new expectations take the
+// ids of a ring of overflow slots, reused oldest first. A parser whose slot was reused
+// reports the newer expectation, while the expectations interned before the table filled up
+// (typically those of the grammars) are never evicted.
+const maxExpectations = 65536;
+const overflowExpectations = 4096;
+const expectationIds = new Map<string, number>();
+const expectations: Array<string> = [];
+let nextOverflowId = maxExpectations;
+
+function expectationId(expected: string): number {
+  let id = expectationIds.get(expected);
+  if (id === undefined) {
+    if (expectations.length < maxExpectations) {
+      id = expectations.length;
+    } else {
+      id = nextOverflowId;
+      nextOverflowId = id + 1 < maxExpectations + overflowExpectations ? id + 1 : maxExpectations;
+      if (id < expectations.length) {
+        expectationIds.delete(expectations[id]);
+      }
+    }
+    expectations[id] = expected;
+    expectationIds.set(expected, id);
+  }
+  return id;
+}
+
+// records the expectation in the context when it's at the furthest offset so far
+function recordFailure(context: ParsingContext | undefined, offset: number, expected: number): void {
+  if (context === undefined || offset < context.furthest) {
+    return;
+  }
+  if (offset > context.furthest) {
+    context.furthest = offset;
+    context.expected.length = 0;
+  }
+  context.expected.push(expected);
+}
+
+const eofExpected = expectationId("EOF");
+
+function fail(state: ParsingState, expected: number): [ParsingState, PartialFailure] {
+  recordFailure(state.context, state.offset, expected);
+  return [state, { type: "failure", expected, offset: state.offset }];
+}
+
+// ids used to key the results of memoized parsers in the parsing context
+let nextMemoId = 0;
+
 // result type used by tailRecM since we don't have a generic Either
 type RecResult<A, B> = {type: "continue"; nextState: A} | {type: "stop"; result: B};
 
@@ -31,145 +151,123 @@ export abstract class Parser<A> {
   // Base signature //
   // -------------- //
 
-  abstract parsePartial(state: ParsingState): [ParsingState, ParsingResult<A>];
+  abstract parsePartial(state: ParsingState): [ParsingState, PartialResult<A>];
 
   // for parse to be considered successful it should consume the entire input
   // so in terms of partialParse we enfore that by making sure EOF is following the parser
-  parse = (input: string): ParsingResult<A> => this.skip(Parser.EOF).parsePartial({ input, offset: 0 })[1];
+  parse = (input: string): ParsingResult<A> => Parser.run(this.skip(Parser.EOF), input);
+
+  // runs the parser from the offset (without requiring the input to be fully consumed), a
+  // failure reports everything that was expected at the furthest offset any parser failed at
+  public static run<A>(p: Parser<A>, input: string, offset = 0): ParsingResult<A> {
+    const context: ParsingContext = { memo: new Map(), furthest: -1, expected: [] };
+    const [, r] = p.parsePartial({ input, offset, context });
+    if (r.type === "success") {
+      return r;
+    }
+
+    const furthest = context.furthest >= r.offset;
+    const failureOffset = furthest ? context.furthest : r.offset;
+    const ids = furthest ? context.expected : [r.expected];
+    return {
+      type: "failure",
+      expected: Array.from(new Set(ids.map((id) => expectations[id]))).join(", "),
+      got: `${input.substring(failureOffset, failureOffset + 20)}...`,
+      offset: failureOffset,
+    };
+  }
+
+  // The id of an expectation for custom parsers (ones implementing parsePartial) to fail
+  // with, see failure. It should be interned once, e.g. when the parser is constructed.
+  public static expectation(expected: string): number {
+    return expectationId(expected);
+  }
+
+  // The failure of a custom parser at the state, expecting the expectation with the id.
+  // It's recorded in the parsing context like the failures of the built in parsers, so
+  // it's reported when it's the furthest one.
+  public static failure(state: ParsingState, expected: number): [ParsingState, PartialFailure] {
+    return fail(state, expected);
+  }
 
   // ---------------- //
   // Concrete Parsers //
   // ---------------- //
   public static EOF: Parser<string> = new class extends Parser<string> {
-      parsePartial = (state: ParsingState): [ParsingState, ParsingResult<string>] => {
-        if (state.input === "") {
+      parsePartial = (state: ParsingState): [ParsingState, PartialResult<string>] => {
+        if (state.offset === state.input.length) {
           return [state, { type: "success", result: "" }];
         }
-
-        return [state, {
-          type: "failure",
-          expected: "EOF",
-          got: `${state.input.substring(0, 20)}...`,
-          offset: state.offset,
-        }];
+        return fail(state, eofExpected);
       }
   }();
 
   // We use generics here to allow typescript correct inference with literals
   // So that str("abc") will produce a Parser<"abc"> and not the general Parser<string>
   public static str<A extends string>(prefix: A): Parser<A> {
-    return new class extends Parser<A> {
-      parsePartial = (state: ParsingState): [ParsingState, ParsingResult<A>] => {
-        if (state.input.startsWith(prefix)) {
-          return [
-            {
-              input: state.input.substring(prefix.length, state.input.length),
-              offset: state.offset + prefix.length,
-            },
-            { type: "success", result: prefix },
-          ];
-        }
-
-        return [state, {
-          type: "failure",
-          expected: prefix,
-          got: `${state.input.substring(0, 20)}...`,
-          offset: state.offset,
-        }];
-      }
-    }();
+    return new LiteralParser(prefix);
   }
 
   public static regex(r: RegExp): Parser<string> {
-    return new class extends Parser<string> {
-      parsePartial = (state: ParsingState): [ParsingState, ParsingResult<string>] => {
-        const match = r.exec(state.input);
-        if (match != null && match.index === 0) {
-          const found = match[0];
-          return [
-            {
-              input: state.input.substring(found.length, state.input.length),
-              offset: state.offset + found.length,
-            },
-            { type: "success", result: found },
-          ];
-        }
+    return new RegexParser(r);
+  }
 
-        return [state, {
-          type: "failure",
-          expected: `${r}`,
-          got: `${state.input.substring(0, 20)}...`,
-          offset: state.offset,
-        }];
-      }
-    }();
+  // matches one of the keywords of the map resulting in its value, using a trie so the cost
+  // doesn't depend on the number of keywords. By default the longest matching keyword is
+  // chosen, with longest set to false the shortest one is
+  public static keywords<T>(map: Record<string, T>, opts?: {longest?: boolean}): Parser<T> {
+    return new KeywordsParser(map, opts?.longest ?? true);
   }
 
   // ------------------ //
   // Combinator Methods //
   // ------------------ //
 
-  // monadic bind
+  // monadic bind, only needed when the next parser depends on the parsed value,
+  // all the other combinators build their parser nodes directly
   public bind<B>(f: (a: A) => Parser<B>): Parser<B> {
-    // a reference for internal classes to refer to without ambiguity with this
-    const self = this;
-    return new class extends Parser<B> {
-      parsePartial = (s0: ParsingState): [ParsingState, ParsingResult<B>] => {
-        const [s1, r] = self.parsePartial(s0);
-        if (r.type === "failure") {
-          return [s1, r];
-        }
-        return f(r.result).parsePartial(s1);
-      }
-    }();
+    return new BindParser(this, f);
   }
 
   public or<B>(pb: Parser<B>): Parser<A | B> {
-    const self = this;
-    return new class extends Parser<A | B> {
-      parsePartial = (s0: ParsingState): [ParsingState, ParsingResult<A | B>] => {
-        const [s1, r] = self.parsePartial(s0);
-        if (r.type === "failure") {
-          return pb.parsePartial(s0);
-        }
-        return [s1, r];
-      }
-    }();
+    return new AltParser<A | B>([this, pb]);
   }
 
   public desc(name: string): Parser<A> {
-    const self = this;
-    return new class extends Parser<A> {
-      parsePartial = (state: ParsingState): [ParsingState, ParsingResult<A>] => {
-        const [s1, r] = self.parsePartial(state);
-        if (r.type === "failure") {
-          return [s1, { ...r, expected: name }];
-        }
-        return [s1, r];
-      }
-    }();
+    return new DescParser(this, name);
   }
 
-  // -------------------------- //
-  // Derived combinator methods //
-  // -------------------------- //
+  // packrat memoization, the result of this parser at every offset is cached for the duration
+  // of a single parse, so backtracking alternatives that share it don't parse the same input again
+  public memo(): Parser<A> {
+    return new MemoParser(this);
+  }
 
   // functor map
   public map<B>(f: (a: A) => B): Parser<B> {
-    return this.bind((a) => Parser.success(f(a)));
-  }
-
-  // applicative functor apply
-  public apply<B>(ff: Parser<(a: A) => B>): Parser<B> {
-    return this.bind((a) => ff.map((f) => f(a)));
+    // fuse consecutive maps into a single node
+    if (this instanceof MapParser) {
+      const g = this.f;
+      return new MapParser(this.parser, (a) => f(g(a)));
+    }
+    return new MapParser(this, f);
   }
 
   public skip<B>(pb: Parser<B>): Parser<A> {
-    return this.bind((a) => pb.map((_) => a));
+    return SeqParser.keeping<A>(this, pb, "left");
   }
 
   public then<B>(pb: Parser<B>): Parser<B> {
-    return this.bind((_) => pb);
+    return SeqParser.keeping<B>(this, pb, "right");
+  }
+
+  // -------------------------- //
+  // Derived combinator methods //
+  // -------------------------- //
+
+  // applicative functor apply
+  public apply<B>(ff: Parser<(a: A) => B>): Parser<B> {
+    return Parser.map2(this, ff, (a, f) => f(a));
   }
 
   public surroundedBy(s: string, e?: string): Parser<A> {
@@ -189,60 +287,51 @@ export abstract class Parser<A> {
   }
 
   public times(min: number, max?: number): Parser<Array<A>> {
-    const minParser = this.repeat(min);
-    if (max === undefined || max <= min) {
-      return minParser;
-    }
-    return Parser.map2(minParser, this.atMost(max - min), (a, b) => [...a, ...b]);
+    return new RepeatParser(this, min, max === undefined || max <= min ? min : max);
   }
 
   public repeat(n: number): Parser<Array<A>> {
-    const self = this;
-    return Parser.tailRecM<[number, Array<A>], Array<A>>([n, []], ([i, collectedValues]) => {
-      if (i <= 0) {
-        return Parser.success({ type: "stop", result: collectedValues });
-      }
-      return self.map(
-        (v) => ({ type: "continue", nextState: [i - 1, [...collectedValues, v]] }),
-      );
-    });
+    return new RepeatParser(this, n, n);
   }
 
   public atMost(n: number): Parser<Array<A>> {
-    const self = this;
-    return Parser.tailRecM<[number, Array<A>], Array<A>>([n, []], ([i, collectedValues]) => {
-      if (i <= 0) {
-        return Parser.success({ type: "stop", result: collectedValues });
-      }
-      return self.map(
-        (v) => ({ type: "continue", nextState: [i - 1, [...collectedValues, v]] }),
-      ).recoverWith({
-        type: "stop",
-        result: collectedValues,
-      }) as Parser<RecResult<[number, Array<A>], Array<A>>>;
-    });
+    return new RepeatParser(this, 0, n);
   }
 
-  public oneOrMoreTimes(opts?: {delimiter?: string; delimiterParser?: Parser<unknown>}): Parser<Array<A>> {
-    if (opts !== undefined && (opts.delimiter !== undefined || opts.delimiterParser !== undefined)) {
-      let preceededByDelim: Parser<A>;
-      if (opts.delimiter !== undefined) {
-        preceededByDelim = Parser.str(opts.delimiter).then(this);
-      } else if (opts.delimiterParser !== undefined) {
-        preceededByDelim = opts.delimiterParser.then(this);
-      } else {
-        throw new Error("Should never reach here");
-      }
+  // zero or more repetitions, parsed by a single loop over this parser
+  public many(): Parser<Array<A>> {
+    return new RepeatParser(this, 0, Number.MAX_SAFE_INTEGER);
+  }
 
-      // a prefix of zero or more items with a delim and an additional end item
-      return this.bind((h) => preceededByDelim.times(0, Number.MAX_SAFE_INTEGER).map((t) => [h, ...t]));
-    }
+  public many1(): Parser<Array<A>> {
+    return new RepeatParser(this, 1, Number.MAX_SAFE_INTEGER);
+  }
+
+  // zero or more repetitions separated by the delimiter, a delimiter which isn't followed by
+  // another repetition isn't consumed
+  public sepBy(delimiter: Parser<unknown>): Parser<Array<A>> {
+    return new SepByParser(this, delimiter, 0);
+  }
 
-    return this.times(1, Number.MAX_SAFE_INTEGER);
+  public sepBy1(delimiter: Parser<unknown>): Parser<Array<A>> {
+    return new SepByParser(this, delimiter, 1);
+  }
+
+  public oneOrMoreTimes(opts?: {delimiter?: string; delimiterParser?: Parser<unknown>}): Parser<Array<A>> {
+    const delimiter = Parser.delimiter(opts);
+    return delimiter === undefined ? this.many1() : this.sepBy1(delimiter);
   }
 
   public zeroOrMoreTimes(opts?: {delimiter?: string; delimiterParser?: Parser<unknown>}): Parser<Array<A>> {
-    return this.oneOrMoreTimes(opts).recoverWith([]);
+    const delimiter = Parser.delimiter(opts);
+    return delimiter === undefined ? this.many() : this.sepBy(delimiter);
+  }
+
+  private static delimiter(opts?: {delimiter?: string; delimiterParser?: Parser<unknown>}): Parser<unknown> | undefined {
+    if (opts?.delimiter !== undefined) {
+      return Parser.str(opts.delimiter);
+    }
+    return opts?.delimiterParser;
   }
 
   public optional(): Parser<A | undefined> {
@@ -254,29 +343,16 @@ export abstract class Parser<A> {
   // -------------------- //
 
   public static success<A>(a: A): Parser<A> {
-    return new class extends Parser<A> {
-      parsePartial = (s0: ParsingState): [ParsingState, ParsingResult<A>] => {
-        return [s0, { type: "success", result: a }];
-      }
-    }();
+    return new SuccessParser(a);
   }
 
   public static fail(expected: string): Parser<never> {
-    return new class extends Parser<never> {
-      parsePartial = (state: ParsingState): [ParsingState, ParsingResult<never>] => {
-        return [state, {
-          type: "failure",
-          expected,
-          got: `${state.input.substring(20)}...`,
-          offset: state.offset,
-        }];
-      }
-    }();
+    return new FailParser(expected);
   }
 
   public static tailRecM<A, B>(init: A, fn: (a: A) => Parser<RecResult<A, B>>): Parser<B> {
     return new class extends Parser<B> {
-      parsePartial = (state: ParsingState): [ParsingState, ParsingResult<B>] => {
+      parsePartial = (state: ParsingState): [ParsingState, PartialResult<B>] => {
         let current: A = init;
         let currentState = state;
 
@@ -287,7 +363,7 @@ export abstract class Parser<A> {
 
           // if parsing failed we're done, just return the failure
           if (parseResult.type === "failure") {
-            return [currentState, parseResult as ParsingResult<B>];
+            return [currentState, parseResult as PartialResult<B>];
           }
 
           // if recursive function indicated we should stop we stop with success
@@ -303,11 +379,11 @@ export abstract class Parser<A> {
   }
 
   public static map2<A, B, C>(pa: Parser<A>, pb: Parser<B>, f: (a: A, b: B) => C): Parser<C> {
-    return pa.apply(pb.map((b) => curried2(flipped2(f))(b)));
+    return Parser.product(pa, pb).map(([a, b]) => f(a, b));
   }
 
   public static product<A, B>(pa: Parser<A>, pb: Parser<B>): Parser<[A, B]> {
-    return Parser.map2(pa, pb, (a, b) => [a, b]);
+    return new SeqParser<[A, B]>([pa, pb]);
   }
 
   // overloaded definition to get more precise types in cases when sequencing parsers of different types
@@ -318,21 +394,1169 @@ export abstract class Parser<A> {
   public static sequence<A, B, C, D, E>(
     a: Parser<A>, b: Parser<B>, c: Parser<C>, d: Parser<D>, e: Parser<E>): Parser<[A, B, C, D, E]>;
   public static sequence<A>(...rest: Array<Parser<A>>): Parser<Array<A>> {
-    return Parser.tailRecM<[number, Array<A>], Array<A>>([0, []], ([i, collectedValues]) => {
-      if (i === rest.length) {
-        return Parser.success({ type: "stop", result: collectedValues });
-      }
-      return rest[i].map(
-        (v) => ({ type: "continue", nextState: [i + 1, [...collectedValues, v]] }),
-      );
-    });
+    return new SeqParser<Array<A>>(rest);
   }
 
   public static alternatives<A>(h: Parser<A>, ...t: Array<Parser<A>>): Parser<A> {
-    return reduce((a, b) => a.or(b), [h, ...t]);
+    return new AltParser([h, ...t]);
   }
 
   public static concat(p: Parser<Array<string>>): Parser<string> {
     return p.map((rs) => rs.join(""));
   }
+
+  // compiles the parser into a single generated javascript function, see ParserCompiler below
+  public static compile<A>(p: Parser<A>): Parser<A> {
+    return new ParserCompiler().compile(p);
+  }
+
+  // parses the inputs while counting invocations and timing every node of the parser,
+  // resulting in the invoked nodes sorted by self time, see profileParser below
+  public static profile(p: Parser<unknown>, inputs: Array<string>): Array<ProfileEntry> {
+    return profileParser(p, inputs);
+  }
+}
+
+// ------------ //
+// Parser Nodes //
+// ------------ //
+
+// The combinators above build a tree out of the following node kinds, where every node
+// parses its children directly. Only bind creates parsers while parsing.
+// The nodes are not allocation free: each step returns a new [state, result] pair, and
+// leaves (str, regex, keywords) also allocate the state after their match, while the other
+// nodes pass on the states of their children. The pairs and the immutable states are the
+// signature of parsePartial, which custom parsers implement, so the nodes keep it rather
+// than sharing a mutable cursor. Parser.compile is the allocation free path: it keeps the
+// offset and the value in locals and only allocates the results.
+
+class LiteralParser<A extends string> extends Parser<A> {
+  readonly prefix: A;
+
+  readonly expected: number;
+
+  constructor(prefix: A) {
+    super();
+    this.prefix = prefix;
+    this.expected = expectationId(prefix);
+  }
+
+  parsePartial = (state: ParsingState): [ParsingState, PartialResult<A>] => {
+    const { prefix } = this;
+    if (state.input.startsWith(prefix, state.offset)) {
+      return [
+        { input: state.input, offset: state.offset + prefix.length, context: state.context },
+        { type: "success", result: prefix },
+      ];
+    }
+
+    return fail(state, this.expected);
+  }
+}
+
+class RegexParser extends Parser<string> {
+  readonly regex: RegExp;
+
+  readonly sticky: RegExp;
+
+  readonly expected: number;
+
+  constructor(regex: RegExp) {
+    super();
+    this.regex = regex;
+    this.sticky = stickyRegex(regex);
+    this.expected = expectationId(`${regex}`);
+  }
+
+  parsePartial = (state: ParsingState): [ParsingState, PartialResult<string>] => {
+    const { sticky } = this;
+    sticky.lastIndex = state.offset;
+    const match = sticky.exec(state.input);
+    if (match != null) {
+      const found = match[0];
+      return [
+        { input: state.input, offset: state.offset + found.length, context: state.context },
+        { type: "success", result: found },
+      ];
+    }
+
+    return fail(state, this.expected);
+  }
+}
+
+interface KeywordNode<T> {
+  children: Map<number, KeywordNode<T>>;
+  // the length of the keyword prefix leading to this node
+  length: number;
+  // whether a keyword ends at this node, in which case it has a value
+  terminal: boolean;
+  value?: T;
+}
+
+class KeywordsParser<T> extends Parser<T> {
+  readonly root: KeywordNode<T> = { children: new Map(), length: 0, terminal: false };
+
+  readonly longest: boolean;
+
+  readonly expected: number;
+
+  constructor(map: Record<string, T>, longest: boolean) {
+    super();
+    this.longest = longest;
+
+    const keywords = Object.keys(map);
+    this.expected = expectationId(keywords.length <= 10 ? keywords.join(" | ") : `one of ${keywords.length} keywords`);
+
+    keywords.forEach((keyword) => {
+      let node = this.root;
+      for (let i = 0; i < keyword.length; i++) {
+        const code = keyword.charCodeAt(i);
+        let child = node.children.get(code);
+        if (child === undefined) {
+          child = { children: new Map(), length: i + 1, terminal: false };
+          node.children.set(code, child);
+        }
+        node = child;
+      }
+      node.terminal = true;
+      node.value = map[keyword];
+    });
+  }
+
+  // the node of the keyword matching the input at the offset, in a single pass over the input
+  match(input: string, offset: number): KeywordNode<T> | undefined {
+    let node: KeywordNode<T> | undefined = this.root;
+    let matched: KeywordNode<T> | undefined;
+    let i = offset;
+    while (node !== undefined) {
+      if (node.terminal) {
+        matched = node;
+        if (!this.longest) {
+          break;
+        }
+      }
+      node = node.children.get(input.charCodeAt(i));
+      i += 1;
+    }
+    return matched;
+  }
+
+  parsePartial = (state: ParsingState): [ParsingState, PartialResult<T>] => {
+    const matched = this.match(state.input, state.offset);
+    if (matched !== undefined) {
+      return [
+        { input: state.input, offset: state.offset + matched.length, context: state.context },
+        { type: "success", result: matched.value as T },
+      ];
+    }
+
+    return fail(state, this.expected);
+  }
+}
+
+class SuccessParser<A> extends Parser<A> {
+  readonly value: A;
+
+  constructor(value: A) {
+    super();
+    this.value = value;
+  }
+
+  parsePartial = (s0: ParsingState): [ParsingState, PartialResult<A>] => [s0, { type: "success", result: this.value }];
+}
+
+class FailParser extends Parser<never> {
+  readonly expected: number;
+
+  constructor(expected: string) {
+    super();
+    this.expected = expectationId(expected);
+  }
+
+  parsePartial = (state: ParsingState): [ParsingState, PartialResult<never>] => fail(state, this.expected);
+}
+
+class MapParser<A, B> extends Parser<B> {
+  readonly parser: Parser<A>;
+
+  readonly f: (a: A) => B;
+
+  constructor(parser: Parser<A>, f: (a: A) => B) {
+    super();
+    this.parser = parser;
+    this.f = f;
+  }
+
+  parsePartial = (s0: ParsingState): [ParsingState, PartialResult<B>] => {
+    const [s1, r] = this.parser.parsePartial(s0);
+    if (r.type === "failure") {
+      return [s1, r];
+    }
+    return [s1, { type: "success", result: this.f(r.result) }];
+  }
+}
+
+// runs the parsers one after the other, resulting in the value of the parser at index keep,
+// or in an array of all the values when keep is undefined
+class SeqParser<A> extends Parser<A> {
+  readonly parsers: Array<Parser<unknown>>;
+
+  readonly keep?: number;
+
+  constructor(parsers: Array<Parser<unknown>>, keep?: number) {
+    super();
+    this.parsers = parsers;
+    this.keep = keep;
+  }
+
+  // a sequence of two parsers keeping only one of the values, chains of skip/then are
+  // flattened into a single node as long as each part of the chain keeps a single value
+  static keeping<C>(pa: Parser<unknown>, pb: Parser<unknown>, side: "left" | "right"): Parser<C> {
+    const [left, leftKeep] = SeqParser.parts(pa);
+    const [right, rightKeep] = SeqParser.parts(pb);
+    return new SeqParser<C>([...left, ...right], side === "left" ? leftKeep : left.length + rightKeep);
+  }
+
+  private static parts(p: Parser<unknown>): [Array<Parser<unknown>>, number] {
+    if (p instanceof SeqParser && p.keep !== undefined) {
+      return [p.parsers, p.keep];
+    }
+    return [[p], 0];
+  }
+
+  parsePartial = (s0: ParsingState): [ParsingState, PartialResult<A>] => {
+    const { parsers, keep } = this;
+    const values: Array<unknown> | undefined = keep === undefined ? [] : undefined;
+    let kept: unknown;
+    let state = s0;
+    for (let i = 0; i < parsers.length; i++) {
+      const [s1, r] = parsers[i].parsePartial(state);
+      if (r.type === "failure") {
+        return [s1, r];
+      }
+      if (values !== undefined) {
+        values.push(r.result);
+      } else if (i === keep) {
+        kept = r.result;
+      }
+      state = s1;
+    }
+    return [state, { type: "success", result: (values ?? kept) as A }];
+  }
+}
+
+// tries the parsers in order from the same state, resulting in the first success
+// or in the failure of the last parser when all of them fail.
+// Branches that can't start with the next character of the input (based on their FIRST
+// sets) are skipped. The last branch is always tried, since its failure is the one reported.
+class AltParser<A> extends Parser<A> {
+  readonly parsers: Array<Parser<A>>;
+
+  // the branches to try by the char code at the current offset, built on first use
+  private dispatch?: Dispatch<Parser<A>>;
+
+  constructor(parsers: Array<Parser<A>>) {
+    super();
+    // nested alternatives are flattened into a single node
+    this.parsers = [];
+    parsers.forEach((p) => {
+      if (p instanceof AltParser) {
+        this.parsers.push(...p.parsers);
+      } else {
+        this.parsers.push(p);
+      }
+    });
+  }
+
+  get dispatchTable(): Dispatch<Parser<A>> {
+    if (this.dispatch === undefined) {
+      this.dispatch = buildDispatch(this.parsers);
+    }
+    return this.dispatch;
+  }
+
+  parsePartial = (s0: ParsingState): [ParsingState, PartialResult<A>] => {
+    const { table, fallback } = this.dispatchTable;
+    const { branches: parsers, skipped } = table.get(s0.input.charCodeAt(s0.offset)) ?? fallback;
+    // the branches that can't start here fail without being tried, but are still expected
+    const { context } = s0;
+    if (context !== undefined && s0.offset >= context.furthest) {
+      for (let i = 0; i < skipped.length; i++) {
+        recordFailure(context, s0.offset, skipped[i]);
+      }
+    }
+    const last = parsers.length - 1;
+    for (let i = 0; i < last; i++) {
+      const attempt = parsers[i].parsePartial(s0);
+      if (attempt[1].type === "success") {
+        return attempt;
+      }
+    }
+    return parsers[last].parsePartial(s0);
+  }
+}
+
+// parses between min and max repetitions of the parser, failing if less than min are found.
+// the values are pushed into a buffer created per invocation of parsePartial, so collecting
+// n values is linear in n, while the parser itself remains pure
+class RepeatParser<A> extends Parser<Array<A>> {
+  readonly parser: Parser<A>;
+
+  readonly min: number;
+
+  readonly max: number;
+
+  constructor(parser: Parser<A>, min: number, max: number) {
+    super();
+    this.parser = parser;
+    this.min = min;
+    this.max = max;
+  }
+
+  parsePartial = (s0: ParsingState): [ParsingState, PartialResult<Array<A>>] => {
+    const { parser, min, max } = this;
+    const values: Array<A> = [];
+    let state = s0;
+    while (values.length < max) {
+      const [s1, r] = parser.parsePartial(state);
+      if (r.type === "failure") {
+        if (values.length < min) {
+          return [s1, r];
+        }
+        break;
+      }
+      values.push(r.result);
+      state = s1;
+    }
+    return [state, { type: "success", result: values }];
+  }
+}
+
+// parses one repetition of the parser and then the delimiter and a repetition as many times
+// as possible, failing if less than min repetitions are found
+class SepByParser<A> extends Parser<Array<A>> {
+  readonly parser: Parser<A>;
+
+  readonly delimiter: Parser<unknown>;
+
+  readonly min: number;
+
+  constructor(parser: Parser<A>, delimiter: Parser<unknown>, min: number) {
+    super();
+    this.parser = parser;
+    this.delimiter = delimiter;
+    this.min = min;
+  }
+
+  parsePartial = (s0: ParsingState): [ParsingState, PartialResult<Array<A>>] => {
+    const { parser, delimiter, min } = this;
+    const values: Array<A> = [];
+    let state = s0;
+    while (true) {
+      // the first repetition isn't preceded by a delimiter
+      let itemState = state;
+      if (values.length > 0) {
+        const [s1, d] = delimiter.parsePartial(state);
+        if (d.type === "failure") {
+          break;
+        }
+        itemState = s1;
+      }
+
+      const [s2, r] = parser.parsePartial(itemState);
+      if (r.type === "failure") {
+        if (values.length < min) {
+          return [s2, r];
+        }
+        break;
+      }
+      values.push(r.result);
+      state = s2;
+    }
+    return [state, { type: "success", result: values }];
+  }
+}
+
+class BindParser<A, B> extends Parser<B> {
+  readonly parser: Parser<A>;
+
+  readonly f: (a: A) => Parser<B>;
+
+  constructor(parser: Parser<A>, f: (a: A) => Parser<B>) {
+    super();
+    this.parser = parser;
+    this.f = f;
+  }
+
+  parsePartial = (s0: ParsingState): [ParsingState, PartialResult<B>] => {
+    const [s1, r] = this.parser.parsePartial(s0);
+    if (r.type === "failure") {
+      return [s1, r];
+    }
+    return this.f(r.result).parsePartial(s1);
+  }
+}
+
+class DescParser<A> extends Parser<A> {
+  readonly parser: Parser<A>;
+
+  readonly name: string;
+
+  readonly expected: number;
+
+  constructor(parser: Parser<A>, name: string) {
+    super();
+    this.parser = parser;
+    this.name = name;
+    this.expected = expectationId(name);
+  }
+
+  parsePartial = (state: ParsingState): [ParsingState, PartialResult<A>] => {
+    const { context } = state;
+    const furthest = context?.furthest;
+    const recorded = context?.expected.length ?? 0;
+    const [s1, r] = this.parser.parsePartial(state);
+    if (r.type === "success") {
+      return [s1, r];
+    }
+
+    // when nothing was consumed past the start, the name replaces what the parser expected there
+    if (context !== undefined && context.furthest === state.offset) {
+      context.expected.length = furthest === state.offset ? recorded : 0;
+      context.expected.push(this.expected);
+    }
+    return [s1, { type: "failure", expected: this.expected, offset: r.offset }];
+  }
+}
+
+class MemoParser<A> extends Parser<A> {
+  readonly parser: Parser<A>;
+
+  readonly id: number;
+
+  constructor(parser: Parser<A>) {
+    super();
+    this.parser = parser;
+    this.id = nextMemoId++;
+  }
+
+  parsePartial = (state: ParsingState): [ParsingState, PartialResult<A>] => {
+    // without a context (parsePartial called directly) there is nowhere to store results
+    if (state.context === undefined) {
+      return this.parser.parsePartial(state);
+    }
+
+    let table = state.context.memo.get(this.id);
+    if (table === undefined) {
+      table = new Map();
+      state.context.memo.set(this.id, table);
+    }
+
+    const cached = table.get(state.offset);
+    if (cached !== undefined) {
+      return cached as [ParsingState, PartialResult<A>];
+    }
+
+    const result = this.parser.parsePartial(state);
+    table.set(state.offset, result);
+    return result;
+  }
+}
+
+// ---------- //
+// FIRST sets //
+// ---------- //
+
+// The FIRST set of a parser is the set of char codes its input must start with for it to
+// succeed, and whether it may also succeed without consuming any input (nullable).
+// It's undefined when it can't be derived statically.
+type FirstSet = {codes: Set<number>; nullable: boolean} | undefined;
+
+// the branches worth trying by the char code at the current offset, in their original order,
+// and the expectations of the skipped branches, which would have failed there.
+// char codes that don't appear in the table can only be matched by the fallback branches
+interface DispatchEntry<P> {
+  branches: Array<P>;
+  skipped: Array<number>;
+}
+
+interface Dispatch<P> {
+  table: Map<number, DispatchEntry<P>>;
+  fallback: DispatchEntry<P>;
+}
+
+function buildDispatch<P extends Parser<unknown>>(branches: Array<P>): Dispatch<P> {
+  const firstSets = branches.map(firstSet);
+  const last = branches.length - 1;
+
+  const entry = (code?: number): DispatchEntry<P> => {
+    const viable: Array<P> = [];
+    const skipped = new Set<number>();
+    branches.forEach((branch, i) => {
+      const first = firstSets[i];
+      if (i === last || first === undefined || first.nullable || (code !== undefined && first.codes.has(code))) {
+        viable.push(branch);
+      } else {
+        leadingExpectations(branch).forEach((id) => skipped.add(id));
+      }
+    });
+    return { branches: viable, skipped: Array.from(skipped) };
+  };
+
+  const table = new Map<number, DispatchEntry<P>>();
+  firstSets.forEach((first) => first?.codes.forEach((code) => {
+    if (!table.has(code)) {
+      table.set(code, entry(code));
+    }
+  }));
+
+  return { table, fallback: entry() };
+}
+
+// The expectations a parser records when it fails at a char code outside its FIRST set, which
+// is how a branch skipped by dispatch would have failed. Only parsers with a known FIRST set
+// are skipped, so only the parsers firstSet knows about are handled.
+function leadingExpectations(p: Parser<unknown>): Array<number> {
+  if (p instanceof LiteralParser || p instanceof KeywordsParser || p instanceof FailParser || p instanceof DescParser) {
+    return [p.expected];
+  }
+  if (p instanceof RegexParser) {
+    // a regex that may match the empty string succeeds instead
+    return firstSet(p)?.nullable ? [] : [p.expected];
+  }
+  if (p === Parser.EOF) {
+    return [eofExpected];
+  }
+  if (p instanceof MapParser || p instanceof MemoParser || p instanceof RepeatParser || p instanceof SepByParser) {
+    return leadingExpectations(p.parser);
+  }
+  if (p instanceof SeqParser) {
+    // the leading nullable parts are tried (and may fail) before the first one that must consume
+    const expected: Array<number> = [];
+    for (let i = 0; i < p.parsers.length; i++) {
+      expected.push(...leadingExpectations(p.parsers[i]));
+      if (!firstSet(p.parsers[i])?.nullable) {
+        break;
+      }
+    }
+    return expected;
+  }
+  if (p instanceof AltParser) {
+    return p.parsers.flatMap(leadingExpectations);
+  }
+  return [];
+}
+
+// the FIRST set of a sequence, which includes the FIRST sets of its leading nullable parts
+function sequenceFirstSet(parsers: Array<Parser<unknown>>): FirstSet {
+  const codes = new Set<number>();
+  for (let i = 0; i < parsers.length; i++) {
+    const first = firstSet(parsers[i]);
+    if (first === undefined) {
+      return undefined;
+    }
+    first.codes.forEach((code) => codes.add(code));
+    if (!first.nullable) {
+      return { codes, nullable: false };
+    }
+  }
+  return { codes, nullable: true };
+}
+
+const firstSetCache = new WeakMap<Parser<unknown>, FirstSet>();
+
+function firstSet(p: Parser<unknown>): FirstSet {
+  if (firstSetCache.has(p)) {
+    return firstSetCache.get(p);
+  }
+  // mark as unknown while computing it, in case of cycles through custom parsers
+  firstSetCache.set(p, undefined);
+
+  let first: FirstSet;
+  if (p instanceof LiteralParser) {
+    first = p.prefix.length > 0
+      ? { codes: new Set([p.prefix.charCodeAt(0)]), nullable: false }
+      : { codes: new Set(), nullable: true };
+  } else if (p instanceof RegexParser) {
+    first = regexFirstSet(p.regex);
+  } else if (p instanceof KeywordsParser) {
+    first = { codes: new Set(p.root.children.keys()), nullable: p.root.terminal };
+  } else if (p instanceof SuccessParser || p === Parser.EOF) {
+    first = { codes: new Set(), nullable: true };
+  } else if (p instanceof FailParser) {
+    first = { codes: new Set(), nullable: false };
+  } else if (p instanceof MapParser || p instanceof DescParser || p instanceof MemoParser) {
+    first = firstSet(p.parser);
+  } else if (p instanceof SeqParser) {
+    first = sequenceFirstSet(p.parsers);
+  } else if (p instanceof RepeatParser || p instanceof SepByParser) {
+    const child = firstSet(p.parser);
+    first = child && { codes: child.codes, nullable: child.nullable || p.min === 0 };
+  } else if (p instanceof AltParser) {
+    const codes = new Set<number>();
+    let nullable = false;
+    const known = p.parsers.every((branch: Parser<unknown>) => {
+      const branchFirst = firstSet(branch);
+      branchFirst?.codes.forEach((code) => codes.add(code));
+      nullable = nullable || branchFirst?.nullable === true;
+      return branchFirst !== undefined;
+    });
+    first = known ? { codes, nullable } : undefined;
+  }
+
+  firstSetCache.set(p, first);
+  return first;
+}
+
+function charRange(from: string, to: string): Array<number> {
+  const codes = [];
+  for (let code = from.charCodeAt(0); code <= to.charCodeAt(0); code++) {
+    codes.push(code);
+  }
+  return codes;
+}
+
+const digitCodes = charRange("0", "9");
+const wordCodes = [...charRange("a", "z"), ...charRange("A", "Z"), ...digitCodes, "_".charCodeAt(0)];
+const whitespaceCodes = [
+  ..."\t\n\v\f\r \u00a0\u1680\u2028\u2029\u202f\u205f\u3000\ufeff".split("").map((c) => c.charCodeAt(0)),
+  ...charRange("\u2000", "\u200a"),
+];
+const regexSpecialChars = "\\^$.|?*+()[]{}/";
+
+// Derives the FIRST set of simple regexes, a sequence of literal characters, character
+// classes and the \d, \w and \s escapes, where leading atoms may be optional (?, * or {0,n}).
+// Anything else (groups, alternation, negated classes, flags) is considered unknown.
+function regexFirstSet(r: RegExp): FirstSet {
+  if (r.flags.replace(/[gy]/g, "") !== "" || r.source.includes("|")) {
+    return undefined;
+  }
+
+  const source = r.source;
+  const codes = new Set<number>();
+  let i = 0;
+
+  // reads a single escape or character at the current position, undefined if it's not supported
+  const readAtom = (inClass: boolean): Array<number> | undefined => {
+    const c = source[i];
+    if (c === "\\") {
+      const escaped = source[i + 1];
+      i += 2;
+      if (escaped === "d") return digitCodes;
+      if (escaped === "w") return wordCodes;
+      if (escaped === "s") return whitespaceCodes;
+      if (escaped !== undefined && regexSpecialChars.includes(escaped)) return [escaped.charCodeAt(0)];
+      if (inClass && escaped === "-") return [escaped.charCodeAt(0)];
+      return undefined;
+    }
+    i += 1;
+    if (!inClass && regexSpecialChars.includes(c)) {
+      return undefined;
+    }
+    return [c.charCodeAt(0)];
+  };
+
+  const readClass = (): Array<number> | undefined => {
+    i += 1; // [
+    if (source[i] === "^") {
+      return undefined;
+    }
+    const classCodes: Array<number> = [];
+    while (i < source.length && source[i] !== "]") {
+      const from = source[i];
+      const atom = readAtom(true);
+      if (atom === undefined) {
+        return undefined;
+      }
+      // a range between two single characters
+      if (from !== "\\" && source[i] === "-" && source[i + 1] !== "]" && source[i + 1] !== undefined) {
+        i += 1;
+        if (source[i] === "\\") {
+          return undefined;
+        }
+        classCodes.push(...charRange(from, source[i]));
+        i += 1;
+      } else {
+        classCodes.push(...atom);
+      }
+    }
+    i += 1; // ]
+    return classCodes;
+  };
+
+  while (i < source.length) {
+    const atom = source[i] === "[" ? readClass() : readAtom(false);
+    if (atom === undefined) {
+      return undefined;
+    }
+    atom.forEach((code) => codes.add(code));
+
+    const quantifier = source[i];
+    const optional = quantifier === "?" || quantifier === "*" || source.startsWith("{0", i);
+    if (!optional) {
+      return { codes, nullable: false };
+    }
+
+    // skip the quantifier (including a lazy modifier) and continue with the next atom
+    i = quantifier === "{" ? source.indexOf("}", i) + 1 : i + 1;
+    if (source[i] === "?") {
+      i += 1;
+    }
+  }
+
+  // every atom is optional so the regex may match the empty string
+  return { codes, nullable: true };
+}
+
+// ----------- //
+// Compilation //
+// ----------- //
+
+// Generates javascript source for a parser tree and evaluates it with new Function.
+// Every node becomes a function from a position to the end position of its match (or -1 on
+// failure), passing its value through a shared variable, so no state or result objects are
+// allocated until the final result is returned. Literals are inlined into charCodeAt checks.
+// Nodes that can't be compiled (bind, tailRecM, custom parsers) are called through their
+// parsePartial, and memoized nodes store their results in the memo table of the context.
+class ParserCompiler {
+  private readonly names = new Map<Parser<unknown>, string>();
+
+  private readonly functions: Array<string> = [];
+
+  private readonly externals: Array<unknown> = [];
+
+  compile<A>(p: Parser<A>): Parser<A> {
+    const root = this.node(p);
+    const constants = this.externals.map((_, i) => `const e${i} = ext[${i}];`);
+    const source = `
+      let input = "";
+      let context = undefined;
+      let value = undefined;
+      let failOffset = 0;
+      let failExpected = 0;
+      // the furthest failure is tracked in locals while running, and stored in the context
+      // (by sync) before calling other parsers and when returning
+      let furthest = -1;
+      let expected = [];
+      let recorded = 0;
+
+      function record(pos, id) {
+        if (pos >= furthest) {
+          if (pos > furthest) { furthest = pos; recorded = 0; }
+          expected[recorded++] = id;
+        }
+      }
+
+      function fail(pos, id) {
+        failOffset = pos;
+        failExpected = id;
+        record(pos, id);
+        return -1;
+      }
+
+      function sync() {
+        if (context !== undefined) {
+          context.furthest = furthest;
+          context.expected.length = recorded;
+        }
+      }
+
+      function load() {
+        furthest = context === undefined ? -1 : context.furthest;
+        expected = context === undefined ? [] : context.expected;
+        recorded = expected.length;
+      }
+
+      ${constants.join("\n")}
+
+      ${this.functions.join("\n\n")}
+
+      return function (state) {
+        // save the current input to allow reentrant calls from within map functions
+        const prevInput = input;
+        const prevContext = context;
+        sync();
+        input = state.input;
+        context = state.context;
+        load();
+        try {
+          const end = ${root}(state.offset);
+          if (end >= 0) {
+            return [{ input, offset: end, context }, { type: "success", result: value }];
+          }
+          return [{ input, offset: failOffset, context }, { type: "failure", expected: failExpected, offset: failOffset }];
+        } finally {
+          sync();
+          input = prevInput;
+          context = prevContext;
+          load();
+          value = undefined;
+        }
+      };
+    `;
+
+    // eslint-disable-next-line @typescript-eslint/no-implied-eval, no-new-func
+    const run = new Function("ext", source)(this.externals);
+    return new class extends Parser<A> {
+      parsePartial = (state: ParsingState): [ParsingState, PartialResult<A>] => run(state);
+    }();
+  }
+
+  private external(value: unknown): string {
+    this.externals.push(value);
+    return `e${this.externals.length - 1}`;
+  }
+
+  // returns the name of the generated function for the node, generating it on first use
+  private node(p: Parser<unknown>): string {
+    const existing = this.names.get(p);
+    if (existing !== undefined) {
+      return existing;
+    }
+
+    const name = `p${this.names.size}`;
+    this.names.set(p, name);
+    this.functions.push(`function ${name}(pos) {\n${this.body(p)}\n}`);
+    return name;
+  }
+
+  // records the expectations of the skipped branches and tries the others in order, returning
+  // the end of the first success or the last failure
+  private alternatives({ branches, skipped }: DispatchEntry<Parser<unknown>>): string {
+    const names = branches.map((branch) => this.node(branch));
+    const attempts = names.slice(0, -1).map((name) => `
+      end = ${name}(pos);
+      if (end >= 0) { return end; }`);
+    return `${skipped.map((id) => `
+      record(pos, ${id});`).join("")}${attempts.join("")}
+      return ${names[names.length - 1]}(pos);`;
+  }
+
+  private body(p: Parser<unknown>): string {
+    if (p === Parser.EOF) {
+      return `
+        if (pos === input.length) { value = ""; return pos; }
+        return fail(pos, ${eofExpected});`;
+    }
+
+    if (p instanceof LiteralParser) {
+      const { prefix } = p;
+      const literal = this.external(prefix);
+      let condition = `input.startsWith(${literal}, pos)`;
+      if (prefix.length === 0) {
+        condition = "true";
+      } else if (prefix.length <= 16) {
+        // compared per UTF-16 unit, the same units startsWith compares
+        const checks: Array<string> = [];
+        for (let i = 0; i < prefix.length; i++) {
+          checks.push(`input.charCodeAt(pos + ${i}) === ${prefix.charCodeAt(i)}`);
+        }
+        condition = checks.join(" && ");
+      }
+      return `
+        if (${condition}) { value = ${literal}; return pos + ${prefix.length}; }
+        return fail(pos, ${p.expected});`;
+    }
+
+    if (p instanceof RegexParser) {
+      const regex = this.external(p.sticky);
+      return `
+        ${regex}.lastIndex = pos;
+        const match = ${regex}.exec(input);
+        if (match !== null) { value = match[0]; return pos + value.length; }
+        return fail(pos, ${p.expected});`;
+    }
+
+    if (p instanceof KeywordsParser) {
+      const keywords = this.external(p);
+      return `
+        const matched = ${keywords}.match(input, pos);
+        if (matched !== undefined) { value = matched.value; return pos + matched.length; }
+        return fail(pos, ${p.expected});`;
+    }
+
+    if (p instanceof SuccessParser) {
+      return `value = ${this.external(p.value)}; return pos;`;
+    }
+
+    if (p instanceof FailParser) {
+      return `return fail(pos, ${p.expected});`;
+    }
+
+    if (p instanceof MapParser) {
+      return `
+        const end = ${this.node(p.parser)}(pos);
+        if (end < 0) { return -1; }
+        value = ${this.external(p.f)}(value);
+        return end;`;
+    }
+
+    if (p instanceof SeqParser) {
+      const steps = p.parsers.map((child: Parser<unknown>, i: number) => {
+        let collect = "";
+        if (p.keep === undefined) {
+          collect = "values.push(value);";
+        } else if (p.keep === i) {
+          collect = "kept = value;";
+        }
+        return `
+          pos = ${this.node(child)}(pos);
+          if (pos < 0) { return -1; }
+          ${collect}`;
+      });
+      return `
+        ${p.keep === undefined ? "const values = [];" : "let kept;"}
+        ${steps.join("")}
+        value = ${p.keep === undefined ? "values" : "kept"};
+        return pos;`;
+    }
+
+    if (p instanceof AltParser) {
+      // the dispatch table becomes a switch over the char code at the current position
+      const { table, fallback } = p.dispatchTable;
+      const cases = new Map<string, Array<number>>();
+      table.forEach((entry: DispatchEntry<Parser<unknown>>, code: number) => {
+        const attempts = this.alternatives(entry);
+        cases.set(attempts, [...(cases.get(attempts) ?? []), code]);
+      });
+      const switchCases = [...cases.entries()].map(([attempts, codes]) => `
+          ${codes.map((code) => `case ${code}:`).join(" ")} {
+            ${attempts}
+          }`);
+      return `
+        let end;
+        switch (input.charCodeAt(pos)) {
+          ${switchCases.join("")}
+          default: {
+            ${this.alternatives(fallback)}
+          }
+        }`;
+    }
+
+    if (p instanceof RepeatParser) {
+      return `
+        const values = [];
+        while (values.length < ${p.max}) {
+          const end = ${this.node(p.parser)}(pos);
+          if (end < 0) {
+            if (values.length < ${p.min}) { return -1; }
+            break;
+          }
+          values.push(value);
+          pos = end;
+        }
+        value = values;
+        return pos;`;
+    }
+
+    if (p instanceof SepByParser) {
+      return `
+        const values = [];
+        while (true) {
+          let itemPos = pos;
+          if (values.length > 0) {
+            itemPos = ${this.node(p.delimiter)}(pos);
+            if (itemPos < 0) { break; }
+          }
+          const end = ${this.node(p.parser)}(itemPos);
+          if (end < 0) {
+            if (values.length < ${p.min}) { return -1; }
+            break;
+          }
+          values.push(value);
+          pos = end;
+        }
+        value = values;
+        return pos;`;
+    }
+
+    if (p instanceof DescParser) {
+      // see DescParser.parsePartial
+      return `
+        const prevFurthest = furthest;
+        const prevRecorded = recorded;
+        const end = ${this.node(p.parser)}(pos);
+        if (end >= 0) { return end; }
+        if (furthest === pos) {
+          recorded = prevFurthest === pos ? prevRecorded : 0;
+          expected[recorded++] = ${p.expected};
+        }
+        failExpected = ${p.expected};
+        return -1;`;
+    }
+
+    if (p instanceof MemoParser) {
+      // see MemoParser.parsePartial, the results are stored in the same memo table so they're
+      // shared with the parsers called through parsePartial
+      const parser = this.node(p.parser);
+      return `
+        if (context === undefined) { return ${parser}(pos); }
+        let table = context.memo.get(${p.id});
+        if (table === undefined) {
+          table = new Map();
+          context.memo.set(${p.id}, table);
+        }
+        const cached = table.get(pos);
+        if (cached !== undefined) {
+          const [s, r] = cached;
+          if (r.type === "success") { value = r.result; return s.offset; }
+          failOffset = r.offset;
+          failExpected = r.expected;
+          return -1;
+        }
+        const end = ${parser}(pos);
+        table.set(pos, end >= 0
+          ? [{ input, offset: end, context }, { type: "success", result: value }]
+          : [{ input, offset: failOffset, context }, { type: "failure", expected: failExpected, offset: failOffset }]);
+        return end;`;
+    }
+
+    return `
+      sync();
+      const [s1, r] = ${this.external(p)}.parsePartial({ input, offset: pos, context });
+      load();
+      // the failure was already recorded in the context by the parser itself
+      if (r.type === "failure") { failOffset = r.offset; failExpected = r.expected; return -1; }
+      value = r.result;
+      return s1.offset;`;
+  }
+}
+
+// --------- //
+// Profiling //
+// --------- //
+
+export interface ProfileEntry {
+  // the desc name of the node, or a name derived from its kind and children
+  label: string;
+  invocations: number;
+  successes: number;
+  failures: number;
+  // failures after consuming input, which the enclosing parsers have to backtrack from
+  backtracks: number;
+  // milliseconds spent in the node, with and without the time spent in its children
+  totalTime: number;
+  selfTime: number;
+}
+
+// the child nodes of a node, parsers created while parsing by bind are not included
+function childNodes(p: Parser<unknown>): Array<Parser<unknown>> {
+  if (p instanceof SeqParser || p instanceof AltParser) {
+    return p.parsers;
+  }
+  if (p instanceof MapParser || p instanceof RepeatParser || p instanceof BindParser
+    || p instanceof DescParser || p instanceof MemoParser) {
+    return [p.parser];
+  }
+  if (p instanceof SepByParser) {
+    return [p.parser, p.delimiter];
+  }
+  return [];
+}
+
+const maxLabelLength = 60;
+
+function nodeLabel(p: Parser<unknown>, depth = 2): string {
+  let label: string;
+  const children = (separator: string) => childNodes(p)
+    .map((child) => (depth > 0 ? nodeLabel(child, depth - 1) : "..."))
+    .join(separator);
+
+  if (p instanceof DescParser) {
+    label = p.name;
+  } else if (p instanceof LiteralParser) {
+    label = JSON.stringify(p.prefix);
+  } else if (p instanceof RegexParser) {
+    label = `${p.regex}`;
+  } else if (p instanceof KeywordsParser) {
+    label = `keywords(${expectations[p.expected]})`;
+  } else if (p instanceof FailParser) {
+    label = `fail(${expectations[p.expected]})`;
+  } else if (p instanceof SuccessParser) {
+    label = "success";
+  } else if (p === Parser.EOF) {
+    label = "EOF";
+  } else if (p instanceof SeqParser) {
+    label = `seq(${children(", ")})`;
+  } else if (p instanceof AltParser) {
+    label = `alt(${children(" | ")})`;
+  } else if (p instanceof RepeatParser) {
+    label = `repeat(${children("")}, ${p.min}, ${p.max})`;
+  } else if (p instanceof SepByParser) {
+    label = `sepBy(${children(", ")}, ${p.min})`;
+  } else if (p instanceof MapParser || p instanceof BindParser || p instanceof MemoParser) {
+    const kind = p instanceof MapParser ? "map" : p instanceof BindParser ? "bind" : "memo";
+    label = `${kind}(${children("")})`;
+  } else {
+    label = p.constructor.name || "parser";
+  }
+  return label.length > maxLabelLength ? `${label.substring(0, maxLabelLength - 3)}...` : label;
+}
+
+// Replaces the parsePartial of every node reachable from the parser with an instrumented one
+// for the duration of the profiling, and restores the original ones afterwards, so parsers
+// don't pay anything for profiling unless they are being profiled. Compiled parsers and
+// parsers created by bind are profiled as a whole, as part of the node that invoked them.
+function profileParser(p: Parser<unknown>, inputs: Array<string>): Array<ProfileEntry> {
+  const entries = new Map<Parser<unknown>, ProfileEntry>();
+  const originals = new Map<Parser<unknown>, Parser<unknown>["parsePartial"]>();
+  // the time spent in the children of the currently running node
+  let childTime = 0;
+
+  const instrument = (node: Parser<unknown>) => {
+    if (originals.has(node)) {
+      return;
+    }
+    const original = node.parsePartial;
+    const entry: ProfileEntry = {
+      label: nodeLabel(node),
+      invocations: 0,
+      successes: 0,
+      failures: 0,
+      backtracks: 0,
+      totalTime: 0,
+      selfTime: 0,
+    };
+    originals.set(node, original);
+    entries.set(node, entry);
+
+    node.parsePartial = (state: ParsingState) => {
+      const outerChildTime = childTime;
+      childTime = 0;
+      const start = performance.now();
+      const result = original(state);
+      const elapsed = performance.now() - start;
+
+      entry.invocations += 1;
+      entry.totalTime += elapsed;
+      entry.selfTime += elapsed - childTime;
+      childTime = outerChildTime + elapsed;
+      if (result[1].type === "success") {
+        entry.successes += 1;
+      } else {
+        entry.failures += 1;
+        if (result[1].offset > state.offset) {
+          entry.backtracks += 1;
+        }
+      }
+      return result;
+    };
+    childNodes(node).forEach(instrument);
+  };
+
+  // not built with skip, since that would flatten p into the new node
+  const root = new SeqParser<unknown>([p, Parser.EOF], 0);
+  instrument(root);
+  try {
+    inputs.forEach((input) => Parser.run(root, input));
+  } finally {
+    originals.forEach((original, node) => {
+      node.parsePartial = original;
+    });
+  }
+
+  entries.delete(root);
+  return [...entries.values()]
+    .filter((entry) => entry.invocations > 0)
+    .sort((a, b) => b.selfTime - a.selfTime);
 }
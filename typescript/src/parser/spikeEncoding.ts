@@ -0,0 +1,352 @@
+import {
+  Capture, Constraint, ConstraintType, SearchTerm, SpikeQuery, Value,
+} from "./spikeQuery";
+
+// A compact binary encoding of parsed queries, for shipping many of them at once.
+// Every string (words, values, list and capture names) is stored once in a string table
+// shared by all the encoded queries, and referenced by its index. All the numbers are
+// unsigned LEB128 varints, and the tags are single bytes:
+//
+// encoding:   version, string count, strings, query count, queries
+// string:     byte length, utf-8 bytes
+// query:      term count, terms
+// term:       term tag, word, and for anchors and captures:
+//             [captures only: flags (1 = has name, 2 = has expand), name?, expand?]
+//             constraint count, constraints
+// constraint: constraint tag, alternative count, alternatives
+// alternative: string index << 1 | (1 for a {list} value)
+
+const version = 1;
+
+export const termTags = { token: 0, anchor: 1, capture: 2 } as const;
+export const constraintTags: Record<ConstraintType, number> = { word: 0, lemma: 1, tag: 2, entity: 3 };
+
+const termTypes: Array<SearchTerm["type"]> = ["token", "anchor", "capture"];
+const constraintTypes: Array<ConstraintType> = ["word", "lemma", "tag", "entity"];
+
+const hasName = 1;
+const hasExpand = 2;
+
+// -------- //
+// Encoding //
+// -------- //
+
+class ByteWriter {
+  bytes = new Uint8Array(256);
+
+  length = 0;
+
+  private reserve(size: number): void {
+    if (this.length + size > this.bytes.length) {
+      const grown = new Uint8Array(Math.max(this.bytes.length * 2, this.length + size));
+      grown.set(this.bytes.subarray(0, this.length));
+      this.bytes = grown;
+    }
+  }
+
+  byte(value: number): void {
+    this.reserve(1);
+    this.bytes[this.length++] = value;
+  }
+
+  varint(value: number): void {
+    this.reserve(5);
+    let rest = value;
+    while (rest >= 0x80) {
+      this.bytes[this.length++] = (rest & 0x7f) | 0x80;
+      rest >>>= 7;
+    }
+    this.bytes[this.length++] = rest;
+  }
+
+  raw(bytes: Uint8Array): void {
+    this.reserve(bytes.length);
+    this.bytes.set(bytes, this.length);
+    this.length += bytes.length;
+  }
+}
+
+export function encodeSpikeQueries(queries: Array<SpikeQuery>): Uint8Array {
+  const strings = new Map<string, number>();
+  const index = (s: string): number => {
+    let i = strings.get(s);
+    if (i === undefined) {
+      i = strings.size;
+      strings.set(s, i);
+    }
+    return i;
+  };
+
+  // the queries are written first so the string table is known once they're done
+  const body = new ByteWriter();
+  body.varint(queries.length);
+  queries.forEach(({ terms }) => {
+    body.varint(terms.length);
+    terms.forEach((term) => {
+      body.byte(termTags[term.type]);
+      body.varint(index(term.word));
+      if (term.type === "token") {
+        return;
+      }
+      if (term.type === "capture") {
+        body.byte((term.name !== undefined ? hasName : 0) | (term.expand !== undefined ? hasExpand : 0));
+        if (term.name !== undefined) {
+          body.varint(index(term.name));
+        }
+        if (term.expand !== undefined) {
+          body.varint(index(term.expand));
+        }
+      }
+      body.varint(term.constraints.length);
+      term.constraints.forEach((constraint) => {
+        body.byte(constraintTags[constraint.type]);
+        body.varint(constraint.alternatives.length);
+        constraint.alternatives.forEach((value) => {
+          body.varint(value.type === "list" ? index(value.name) * 2 + 1 : index(value.value) * 2);
+        });
+      });
+    });
+  });
+
+  const encoder = new TextEncoder();
+  const out = new ByteWriter();
+  out.varint(version);
+  out.varint(strings.size);
+  strings.forEach((_, s) => {
+    const bytes = encoder.encode(s);
+    out.varint(bytes.length);
+    out.raw(bytes);
+  });
+  out.raw(body.bytes.subarray(0, body.length));
+  return out.bytes.slice(0, out.length);
+}
+
+export function encodeSpikeQuery(query: SpikeQuery): Uint8Array {
+  return encodeSpikeQueries([query]);
+}
+
+// ------- //
+// Reading //
+// ------- //
+
+// Walks encoded queries in place, without materializing objects. The reader is a cursor,
+// open positions it at the start of a query, and then nextTerm, nextConstraint and
+// nextAlternative move it forward, updating the fields describing the current item.
+// Strings are referenced by their index in the string table, see string.
+export class SpikeQueryReader {
+  readonly queryCount: number;
+
+  termCount = 0;
+
+  termTag = 0;
+
+  wordIndex = 0;
+
+  // -1 when the capture has no name or expansion
+  nameIndex = -1;
+
+  expandIndex = -1;
+
+  constraintCount = 0;
+
+  constraintTag = 0;
+
+  alternativeCount = 0;
+
+  valueIndex = 0;
+
+  isList = false;
+
+  private readonly bytes: Uint8Array;
+
+  private position = 0;
+
+  private readonly stringStarts: Int32Array;
+
+  private readonly stringEnds: Int32Array;
+
+  private readonly strings: Array<string | undefined>;
+
+  private readonly queryStarts: Int32Array;
+
+  // what remains to be read in the current query, term and constraint
+  private termsLeft = 0;
+
+  private constraintsLeft = 0;
+
+  private alternativesLeft = 0;
+
+  private readonly decoder = new TextDecoder();
+
+  constructor(bytes: Uint8Array) {
+    this.bytes = bytes;
+    if (this.varint() !== version) {
+      throw new Error("Unsupported encoding of spike queries");
+    }
+
+    const stringCount = this.varint();
+    this.stringStarts = new Int32Array(stringCount);
+    this.stringEnds = new Int32Array(stringCount);
+    this.strings = new Array(stringCount);
+    for (let i = 0; i < stringCount; i++) {
+      const length = this.varint();
+      this.stringStarts[i] = this.position;
+      this.position += length;
+      this.stringEnds[i] = this.position;
+    }
+
+    // find where every query starts by skipping through them
+    this.queryCount = this.varint();
+    this.queryStarts = new Int32Array(this.queryCount);
+    for (let i = 0; i < this.queryCount; i++) {
+      this.queryStarts[i] = this.position;
+      this.skipQuery();
+    }
+  }
+
+  // the string at the index of the string table, decoded on first use
+  string(index: number): string {
+    let s = this.strings[index];
+    if (s === undefined) {
+      s = this.decoder.decode(this.bytes.subarray(this.stringStarts[index], this.stringEnds[index]));
+      this.strings[index] = s;
+    }
+    return s;
+  }
+
+  open(query: number): void {
+    this.position = this.queryStarts[query];
+    this.termCount = this.varint();
+    this.termsLeft = this.termCount;
+    this.constraintsLeft = 0;
+    this.alternativesLeft = 0;
+  }
+
+  // moves to the next term of the query, skipping what's left of the current one
+  nextTerm(): boolean {
+    while (this.nextConstraint()) {
+      // skip the rest of the current term
+    }
+    if (this.termsLeft === 0) {
+      return false;
+    }
+    this.termsLeft -= 1;
+
+    this.termTag = this.bytes[this.position++];
+    this.wordIndex = this.varint();
+    this.nameIndex = -1;
+    this.expandIndex = -1;
+    this.constraintCount = 0;
+    if (this.termTag !== termTags.token) {
+      if (this.termTag === termTags.capture) {
+        const flags = this.bytes[this.position++];
+        if (flags & hasName) {
+          this.nameIndex = this.varint();
+        }
+        if (flags & hasExpand) {
+          this.expandIndex = this.varint();
+        }
+      }
+      this.constraintCount = this.varint();
+    }
+    this.constraintsLeft = this.constraintCount;
+    return true;
+  }
+
+  // moves to the next constraint of the term, skipping what's left of the current one
+  nextConstraint(): boolean {
+    while (this.nextAlternative()) {
+      // skip the rest of the current constraint
+    }
+    if (this.constraintsLeft === 0) {
+      return false;
+    }
+    this.constraintsLeft -= 1;
+    this.constraintTag = this.bytes[this.position++];
+    this.alternativeCount = this.varint();
+    this.alternativesLeft = this.alternativeCount;
+    return true;
+  }
+
+  nextAlternative(): boolean {
+    if (this.alternativesLeft === 0) {
+      return false;
+    }
+    this.alternativesLeft -= 1;
+    const value = this.varint();
+    this.valueIndex = value >>> 1;
+    this.isList = (value & 1) === 1;
+    return true;
+  }
+
+  private skipQuery(): void {
+    this.termsLeft = this.varint();
+    this.constraintsLeft = 0;
+    this.alternativesLeft = 0;
+    while (this.nextTerm()) {
+      // skip the whole query
+    }
+  }
+
+  private varint(): number {
+    let value = 0;
+    let shift = 0;
+    let byte;
+    do {
+      byte = this.bytes[this.position++];
+      value += (byte & 0x7f) * 2 ** shift;
+      shift += 7;
+    } while (byte & 0x80);
+    return value;
+  }
+}
+
+// -------- //
+// Decoding //
+// -------- //
+
+export function decodeSpikeQueries(bytes: Uint8Array): Array<SpikeQuery> {
+  const reader = new SpikeQueryReader(bytes);
+  const queries: Array<SpikeQuery> = [];
+  for (let i = 0; i < reader.queryCount; i++) {
+    reader.open(i);
+    const terms: Array<SearchTerm> = [];
+    while (reader.nextTerm()) {
+      const type = termTypes[reader.termTag];
+      const word = reader.string(reader.wordIndex);
+      if (type === "token") {
+        terms.push({ type, word });
+        continue;
+      }
+
+      const constraints: Array<Constraint> = [];
+      while (reader.nextConstraint()) {
+        const alternatives: Array<Value> = [];
+        while (reader.nextAlternative()) {
+          const s = reader.string(reader.valueIndex);
+          alternatives.push(reader.isList ? { type: "list", name: s } : { type: "literal", value: s });
+        }
+        constraints.push({ type: constraintTypes[reader.constraintTag], alternatives } as Constraint);
+      }
+
+      if (type === "anchor") {
+        terms.push({ type, word, constraints });
+      } else {
+        const capture: Capture = {
+          type,
+          word,
+          constraints,
+          name: reader.nameIndex >= 0 ? reader.string(reader.nameIndex) : undefined,
+          expand: reader.expandIndex >= 0 ? reader.string(reader.expandIndex) : undefined,
+        };
+        terms.push(capture);
+      }
+    }
+    queries.push({ terms });
+  }
+  return queries;
+}
+
+export function decodeSpikeQuery(bytes: Uint8Array): SpikeQuery {
+  return decodeSpikeQueries(bytes)[0];
+}
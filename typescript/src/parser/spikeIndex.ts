@@ -0,0 +1,268 @@
+import * as fs from "fs";
+import {
+  CompileOptions, compileSpikeQuery, constraintValues, fieldCodes, termConstraints, TokenizedSentence,
+} from "./spikeMatcher";
+import { SpikeQuery } from "./spikeQuery";
+
+// ------------- //
+// Posting Lists //
+// ------------- //
+
+// the index of the first element at or after from which is not smaller than target, found by
+// doubling the step from from and then binary searching the last step
+function gallop(list: Int32Array, target: number, from: number): number {
+  let lo = from;
+  let hi = from;
+  let step = 1;
+  while (hi < list.length && list[hi] < target) {
+    lo = hi + 1;
+    hi += step;
+    step *= 2;
+  }
+  hi = Math.min(hi, list.length);
+  while (lo < hi) {
+    const mid = (lo + hi) >>> 1;
+    if (list[mid] < target) {
+      lo = mid + 1;
+    } else {
+      hi = mid;
+    }
+  }
+  return lo;
+}
+
+// intersects sorted posting lists by galloping through the larger one, so the cost is
+// proportional to the smaller list (times the log of the gaps skipped in the larger one)
+export function intersectPostings(a: Int32Array, b: Int32Array): Int32Array {
+  const [small, large] = a.length <= b.length ? [a, b] : [b, a];
+  const result = new Int32Array(small.length);
+  let count = 0;
+  let j = 0;
+  for (let i = 0; i < small.length && j < large.length; i++) {
+    j = gallop(large, small[i], j);
+    if (j < large.length && large[j] === small[i]) {
+      result[count++] = small[i];
+    }
+  }
+  return result.subarray(0, count);
+}
+
+function unionPostings(lists: Array<Int32Array>): Int32Array {
+  if (lists.length === 1) {
+    return lists[0];
+  }
+  const all = new Int32Array(lists.reduce((size, list) => size + list.length, 0));
+  let offset = 0;
+  lists.forEach((list) => {
+    all.set(list, offset);
+    offset += list.length;
+  });
+  all.sort();
+
+  let count = 0;
+  for (let i = 0; i < all.length; i++) {
+    if (count === 0 || all[count - 1] !== all[i]) {
+      all[count++] = all[i];
+    }
+  }
+  return all.subarray(0, count);
+}
+
+// -------------- //
+// Sentence Index //
+// -------------- //
+
+// postings are keyed by the value id and field together
+const fieldCount = 4;
+const postingKey = (field: number, id: number): number => id * fieldCount + field;
+
+const emptyPostings = new Int32Array(0);
+
+// "SPKI" and the version of the file layout
+const fileMagic = 0x494b5053;
+const fileVersion = 1;
+const headerSize = 4;
+
+// An inverted index from the field values of tokens (by their vocabulary ids) to the sorted ids
+// of the sentences containing them. The posting lists are stored back to back in a single
+// array, with the sorted keys and the offset of each key's postings in two other arrays,
+// which is also how they are saved to a file, so loading only wraps views around the file.
+export class SentenceIndex {
+  readonly sentenceCount: number;
+
+  private readonly keys: Int32Array;
+
+  private readonly offsets: Int32Array;
+
+  private readonly postingLists: Int32Array;
+
+  constructor(sentenceCount: number, keys: Int32Array, offsets: Int32Array, postingLists: Int32Array) {
+    this.sentenceCount = sentenceCount;
+    this.keys = keys;
+    this.offsets = offsets;
+    this.postingLists = postingLists;
+  }
+
+  // the sorted ids of the sentences with a token having the value id in the field
+  postings(field: number, id: number): Int32Array {
+    const key = postingKey(field, id);
+    const i = gallop(this.keys, key, 0);
+    if (i === this.keys.length || this.keys[i] !== key) {
+      return emptyPostings;
+    }
+    return this.postingLists.subarray(this.offsets[i], this.offsets[i + 1]);
+  }
+
+  // File layout, all int32 in the platform's byte order:
+  // magic, version, sentence count, key count, keys, offsets (key count + 1), postings
+  save(file: string): void {
+    const header = Int32Array.of(fileMagic, fileVersion, this.sentenceCount, this.keys.length);
+    const fd = fs.openSync(file, "w");
+    try {
+      [header, this.keys, this.offsets, this.postingLists].forEach((array) => {
+        fs.writeSync(fd, new Uint8Array(array.buffer, array.byteOffset, array.byteLength));
+      });
+    } finally {
+      fs.closeSync(fd);
+    }
+  }
+
+  // Node can't memory map files, so the file is read with a single read and the arrays are
+  // views over the read buffer, without decoding or copying the posting lists
+  static load(file: string): SentenceIndex {
+    let bytes: Uint8Array = fs.readFileSync(file);
+    if (bytes.byteOffset % Int32Array.BYTES_PER_ELEMENT !== 0) {
+      bytes = new Uint8Array(bytes);
+    }
+    const ints = new Int32Array(bytes.buffer, bytes.byteOffset, bytes.byteLength >> 2);
+    if (ints.length < headerSize || ints[0] !== fileMagic || ints[1] !== fileVersion) {
+      throw new Error(`${file} is not a sentence index`);
+    }
+
+    // the sizes are checked against the file, so a truncated or corrupt file fails here
+    // rather than resulting in wrong postings
+    const corrupt = (reason: string) => new Error(`${file} is a corrupt sentence index: ${reason}`);
+    const keyCount = ints[3];
+    const offsetsStart = headerSize + keyCount;
+    const postingsStart = offsetsStart + keyCount + 1;
+    if (bytes.byteLength % Int32Array.BYTES_PER_ELEMENT !== 0) {
+      throw corrupt(`its size of ${bytes.byteLength} bytes isn't a whole number of int32`);
+    }
+    if (ints[2] < 0 || keyCount < 0 || postingsStart > ints.length) {
+      throw corrupt(`${ints[2]} sentences and ${keyCount} keys don't fit in ${ints.length} int32`);
+    }
+    const offsets = ints.subarray(offsetsStart, postingsStart);
+    const postingsLength = ints.length - postingsStart;
+    if (offsets[0] !== 0 || offsets[keyCount] !== postingsLength) {
+      throw corrupt(`the postings should end at ${postingsLength}, not ${offsets[keyCount]}`);
+    }
+    for (let i = 0; i < keyCount; i++) {
+      if (offsets[i] > offsets[i + 1]) {
+        throw corrupt(`the offset of key ${i + 1} is before that of key ${i}`);
+      }
+    }
+
+    return new SentenceIndex(ints[2], ints.subarray(headerSize, offsetsStart), offsets, ints.subarray(postingsStart));
+  }
+}
+
+export class SentenceIndexBuilder {
+  private readonly postings = new Map<number, Array<number>>();
+
+  private sentenceCount = 0;
+
+  // adds the sentence resulting in its id, ids are assigned in order starting from 0
+  add(sentence: TokenizedSentence): number {
+    const id = this.sentenceCount++;
+    const columns = [sentence.word, sentence.lemma, sentence.tag, sentence.entity];
+    columns.forEach((column, field) => {
+      for (let i = 0; i < sentence.length; i++) {
+        const key = postingKey(field, column[i]);
+        let list = this.postings.get(key);
+        if (list === undefined) {
+          list = [];
+          this.postings.set(key, list);
+        }
+        // ids are added in increasing order, so the lists stay sorted without duplicates
+        if (list[list.length - 1] !== id) {
+          list.push(id);
+        }
+      }
+    });
+    return id;
+  }
+
+  build(): SentenceIndex {
+    const keys = Int32Array.from(this.postings.keys()).sort();
+    const offsets = new Int32Array(keys.length + 1);
+    keys.forEach((key, i) => {
+      offsets[i + 1] = offsets[i] + (this.postings.get(key) as Array<number>).length;
+    });
+
+    const postingLists = new Int32Array(offsets[keys.length]);
+    keys.forEach((key, i) => postingLists.set(this.postings.get(key) as Array<number>, offsets[i]));
+    return new SentenceIndex(this.sentenceCount, keys, offsets, postingLists);
+  }
+}
+
+// -------- //
+// Planning //
+// -------- //
+
+// The posting lists of the query's constraints, from the most selective one. A sentence must
+// contain a value of every constraint to match, so the candidates are their intersection.
+// Constraints with unknown values (implicit constraints without implicitValue) are skipped.
+export function planQuery(index: SentenceIndex, query: SpikeQuery, opts: CompileOptions): Array<Int32Array> {
+  const lists: Array<Int32Array> = [];
+  query.terms.forEach((term) => termConstraints(term).forEach((constraint) => {
+    const values = constraintValues(constraint, term.word, opts);
+    if (values === undefined) {
+      return;
+    }
+
+    const field = fieldCodes[constraint.type];
+    const postings: Array<Int32Array> = [];
+    values.forEach((value) => {
+      const id = opts.vocabulary.id(value);
+      if (id !== undefined) {
+        postings.push(index.postings(field, id));
+      }
+    });
+    lists.push(postings.length === 0 ? emptyPostings : unionPostings(postings));
+  }));
+  return lists.sort((a, b) => a.length - b.length);
+}
+
+// The ids of the sentences that may match the query, by intersecting the posting lists of
+// its maxConstraints most selective constraints. Undefined when the query has no constraint
+// that can be looked up, in which case every sentence is a candidate.
+export function candidateSentences(
+  index: SentenceIndex,
+  query: SpikeQuery,
+  opts: CompileOptions & {maxConstraints?: number},
+): Int32Array | undefined {
+  const lists = planQuery(index, query, opts).slice(0, opts.maxConstraints ?? 4);
+  if (lists.length === 0) {
+    return undefined;
+  }
+  return lists.reduce((candidates, list) => (candidates.length === 0 ? candidates : intersectPostings(candidates, list)));
+}
+
+// the matches of the query in the indexed sentences, only the candidates are passed to the matcher
+export function* searchIndex(
+  index: SentenceIndex,
+  query: SpikeQuery,
+  opts: CompileOptions,
+  sentence: (id: number) => TokenizedSentence,
+): Generator<{sentence: number; start: number}> {
+  const matcher = compileSpikeQuery(query, opts);
+  const candidates = candidateSentences(index, query, opts);
+  const count = candidates === undefined ? index.sentenceCount : candidates.length;
+  for (let i = 0; i < count; i++) {
+    const id = candidates === undefined ? i : candidates[i];
+    const tokens = sentence(id);
+    for (let start = matcher.find(tokens); start >= 0; start = matcher.find(tokens, start + 1)) {
+      yield { sentence: id, start };
+    }
+  }
+}
@@ -0,0 +1,218 @@
+import { Constraint, ConstraintType, SearchTerm, SpikeQuery } from "./spikeQuery";
+
+// ------------------- //
+// Tokenized Sentences //
+// ------------------- //
+
+// Interns strings into dense integer ids. Sentences and compiled queries must be encoded
+// with the same vocabulary for their ids to be comparable.
+export class Vocabulary {
+  private readonly ids = new Map<string, number>();
+
+  private readonly values: Array<string> = [];
+
+  intern(value: string): number {
+    let id = this.ids.get(value);
+    if (id === undefined) {
+      id = this.values.length;
+      this.values.push(value);
+      this.ids.set(value, id);
+    }
+    return id;
+  }
+
+  id(value: string): number | undefined {
+    return this.ids.get(value);
+  }
+
+  value(id: number): string {
+    return this.values[id];
+  }
+
+  get size(): number {
+    return this.values.length;
+  }
+}
+
+// a sentence stored by columns, the ids of the i-th token are at index i of every column
+export interface TokenizedSentence {
+  length: number;
+  word: Int32Array;
+  lemma: Int32Array;
+  tag: Int32Array;
+  entity: Int32Array;
+}
+
+export interface SentenceToken {
+  word: string;
+  lemma: string;
+  tag: string;
+  entity: string;
+}
+
+export function encodeSentence(vocabulary: Vocabulary, tokens: Array<SentenceToken>): TokenizedSentence {
+  const sentence: TokenizedSentence = {
+    length: tokens.length,
+    word: new Int32Array(tokens.length),
+    lemma: new Int32Array(tokens.length),
+    tag: new Int32Array(tokens.length),
+    entity: new Int32Array(tokens.length),
+  };
+  tokens.forEach((token, i) => {
+    sentence.word[i] = vocabulary.intern(token.word);
+    sentence.lemma[i] = vocabulary.intern(token.lemma);
+    sentence.tag[i] = vocabulary.intern(token.tag);
+    sentence.entity[i] = vocabulary.intern(token.entity);
+  });
+  return sentence;
+}
+
+// ---------------- //
+// Compiled Queries //
+// ---------------- //
+
+export interface CompileOptions {
+  vocabulary: Vocabulary;
+  // the values of the {list_name} constraint values
+  lists?: Record<string, Array<string>>;
+  // the value of an implicit constraint (e.g. [tag]) derived from the term's word, only word
+  // constraints can be derived without it
+  implicitValue?: (type: ConstraintType, word: string) => string;
+}
+
+export interface SpikeMatcher {
+  // the number of tokens every match spans, one per search term
+  readonly length: number;
+  // the captures of the query, by the index of their token relative to the start of a match
+  readonly captures: ReadonlyArray<{name?: string; term: number}>;
+  matchAt(sentence: TokenizedSentence, start: number): boolean;
+  // the start of the first match at or after from, -1 when there is none
+  find(sentence: TokenizedSentence, from?: number): number;
+}
+
+export const fieldCodes: Record<ConstraintType, number> = { word: 0, lemma: 1, tag: 2, entity: 3 };
+
+// no token can have a negative id, so a constraint on a value missing from the lists never matches
+const noValue = -1;
+
+// A token matches a term when it matches all of the term's constraints (AND), and it matches
+// a constraint when its id is one of the alternatives (OR). Terms without constraints match
+// their word.
+export function termConstraints(term: SearchTerm): Array<Constraint> {
+  if (term.type === "token" || term.constraints.length === 0) {
+    return [{ type: "word", alternatives: [{ type: "literal", value: term.word }] }];
+  }
+  return term.constraints;
+}
+
+// the values a constraint of the term with the given word accepts, lists are resolved from the
+// options and undefined is returned for an implicit constraint whose value can't be derived
+export function constraintValues(constraint: Constraint, word: string, opts: CompileOptions): Array<string> | undefined {
+  if (constraint.alternatives.length === 0) {
+    if (constraint.type === "word") {
+      return [word];
+    }
+    return opts.implicitValue === undefined ? undefined : [opts.implicitValue(constraint.type, word)];
+  }
+
+  const values: Array<string> = [];
+  constraint.alternatives.forEach((value) => {
+    if (value.type === "literal") {
+      values.push(value.value);
+      return;
+    }
+    const list = opts.lists?.[value.name];
+    if (list === undefined) {
+      throw new Error(`Unknown list {${value.name}}`);
+    }
+    values.push(...list);
+  });
+  return values;
+}
+
+// the values are interned (rather than looked up) so sentences encoded later can match them
+function constraintIds(constraint: Constraint, word: string, opts: CompileOptions): Set<number> {
+  const values = constraintValues(constraint, word, opts);
+  if (values === undefined) {
+    throw new Error(`Implicit ${constraint.type} constraint of "${word}" requires implicitValue`);
+  }
+  return new Set(values.map((value) => opts.vocabulary.intern(value)));
+}
+
+// Compiles a parsed query into a matcher of consecutive tokens, one per search term.
+// The constraints are flattened into typed arrays, with a single id compared directly and
+// larger alternatives (e.g. resolved lists) looked up in a set, so matching a sentence
+// doesn't allocate.
+export function compileSpikeQuery(query: SpikeQuery, opts: CompileOptions): SpikeMatcher {
+  const { terms } = query;
+  const captures: Array<{name?: string; term: number}> = [];
+  const termStarts = new Int32Array(terms.length + 1);
+  const fields: Array<number> = [];
+  const singles: Array<number> = [];
+  const sets: Array<Set<number> | undefined> = [];
+
+  terms.forEach((term, i) => {
+    if (term.type === "capture") {
+      captures.push({ name: term.name, term: i });
+    }
+    termStarts[i] = fields.length;
+    termConstraints(term).forEach((constraint) => {
+      const ids = constraintIds(constraint, term.word, opts);
+      fields.push(fieldCodes[constraint.type]);
+      if (ids.size <= 1) {
+        singles.push(ids.size === 1 ? ids.values().next().value as number : noValue);
+        sets.push(undefined);
+      } else {
+        singles.push(noValue);
+        sets.push(ids);
+      }
+    });
+  });
+  termStarts[terms.length] = fields.length;
+
+  const fieldArray = Uint8Array.from(fields);
+  const singleArray = Int32Array.from(singles);
+  const { length } = terms;
+
+  const matchAt = (sentence: TokenizedSentence, start: number): boolean => {
+    if (start < 0 || start + length > sentence.length) {
+      return false;
+    }
+    for (let t = 0; t < length; t++) {
+      const position = start + t;
+      for (let c = termStarts[t]; c < termStarts[t + 1]; c++) {
+        const field = fieldArray[c];
+        let id;
+        if (field === 0) {
+          id = sentence.word[position];
+        } else if (field === 1) {
+          id = sentence.lemma[position];
+        } else if (field === 2) {
+          id = sentence.tag[position];
+        } else {
+          id = sentence.entity[position];
+        }
+
+        const set = sets[c];
+        if (set === undefined ? id !== singleArray[c] : !set.has(id)) {
+          return false;
+        }
+      }
+    }
+    return true;
+  };
+
+  return {
+    length,
+    captures,
+    matchAt,
+    find: (sentence: TokenizedSentence, from = 0) => {
+      for (let start = from; start + length <= sentence.length; start++) {
+        if (matchAt(sentence, start)) {
+          return start;
+        }
+      }
+      return -1;
+    },
+  };
+}
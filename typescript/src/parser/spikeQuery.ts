@@ -1,4 +1,5 @@
-import { Parser as P, ParsingResult } from "./parserCombinator";
+import { Parser as P, ParsingResult, ParsingState, ProfileEntry } from "./parserCombinator";
+import { CacheStats, deepFreeze, LRUCache } from "./utils";
 
 // ---------------- //
 // Parsed Structure //
@@ -36,8 +37,8 @@ export interface EntityConstraint {
   alternatives: Array<Value>;
 }
 
-type Constraint = WordConstraint | TagConstraint | LemmaConstraint | EntityConstraint;
-type ConstraintType = Constraint["type"]
+export type Constraint = WordConstraint | TagConstraint | LemmaConstraint | EntityConstraint;
+export type ConstraintType = Constraint["type"]
 
 export interface Token {
   type: "token";
@@ -78,16 +79,16 @@ const whitespace = P.regex(/\s+/).desc("white space");
 const escapedValue = P.regex(/[^`]*/).surroundedBy("`");
 
 // name of a field (including the shorthand aliases)
-const fieldName = P.alternatives(
-  P.str("word"),
-  P.str("w").result("word"),
-  P.str("lemma"),
-  P.str("l").result("lemma"),
-  P.str("tag"),
-  P.str("t").result("tag"),
-  P.str("entity"),
-  P.str("e").result("entity"),
-).desc("field name");
+const fieldName = P.keywords<ConstraintType>({
+  word: "word",
+  w: "word",
+  lemma: "lemma",
+  l: "lemma",
+  tag: "tag",
+  t: "tag",
+  entity: "entity",
+  e: "entity",
+}).desc("field name");
 
 // constrinat values, for example:
 // abc
@@ -126,6 +127,9 @@ const multipleFiledConstraintsExpression = singleFieldExpression.oneOrMoreTimes(
   { delimiter: "&" },
 ).desc("fields AND expression");
 const tokenConstraintsExpression = multipleFiledConstraintsExpression.surroundedBy("[", "]").desc("token constratins");
+// no token constraints result in an empty list, a new one every time, since results (and so a shared
+// list) are frozen by the query cache
+const optionalConstraints = tokenConstraintsExpression.optional().map((constraints) => constraints ?? []);
 
 const numberToken = P.regex(/-?\d+(\.\d+)?/);
 const unescapedToken = P.regex(/[^\s[\]<>:$?][a-zA-Z-0-9|&]*/);
@@ -135,7 +139,7 @@ const token = P.alternatives(escapedValue, numberToken, unescapedToken).map<Toke
 // single anchor token
 const anchor = P.sequence(
   P.str("$"),
-  tokenConstraintsExpression.recoverWith([]), // if no token constraints change the result to empty list
+  optionalConstraints,
   token,
 ).map<Anchor>(
   ([_, constraints, t]) => ({ ...t, constraints, type: "anchor" }),
@@ -149,7 +153,7 @@ const capture = P.sequence(
   expansion.optional(),
   captureName.optional(),
   P.str(":"),
-  tokenConstraintsExpression.recoverWith([]), // if no token constraints change the result to empty list
+  optionalConstraints,
   token,
 ).map<Capture>(
   ([expand, name, _, constraints, t]) => ({
@@ -168,8 +172,252 @@ const searchTerm = P.alternatives<SearchTerm>(capture, anchor, token, specialSin
 // the full parser for the structured query language
 // the optional whitespace delimiter is intentional and it helps in separation of it's into it and 's
 // (all the search terms are defined in a way where this works)
-const spikeQuery = searchTerm.zeroOrMoreTimes({ delimiterParser: whitespace.optional() }).map((terms) => ({ terms }));
-
-export function parseStructuralQuery(queryString: string): ParsingResult<SpikeQuery> {
+const termDelimiter = whitespace.optional();
+export const spikeQuery = searchTerm.zeroOrMoreTimes({ delimiterParser: termDelimiter }).map((terms) => ({ terms }));
+
+// the compiled parser is only generated on first use, since generating code with
+// new Function is not allowed in some environments (e.g. under a strict CSP)
+let compiledSpikeQuery: P<SpikeQuery> | undefined;
+
+export function parseStructuralQuery(queryString: string, opts?: {compiled?: boolean}): ParsingResult<SpikeQuery> {
+  if (opts?.compiled) {
+    if (compiledSpikeQuery === undefined) {
+      compiledSpikeQuery = P.compile(spikeQuery.skip(P.EOF));
+    }
+    return P.run(compiledSpikeQuery, queryString);
+  }
   return spikeQuery.parse(queryString);
 }
+
+// the time spent in each part of the grammar while parsing the queries, see Parser.profile
+export function profileStructuralQueries(queries: Array<string>): Array<ProfileEntry> {
+  return P.profile(spikeQuery, queries);
+}
+
+// ------------------- //
+// Incremental Parsing //
+// ------------------- //
+
+interface TermSpan {
+  term: SearchTerm;
+  start: number;
+  end: number;
+  // the number of backticks in the text before end
+  backticks: number;
+}
+
+function countBackticks(text: string, start: number, end: number): number {
+  let count = 0;
+  for (let i = text.indexOf("`", start); i >= 0 && i < end; i = text.indexOf("`", i + 1)) {
+    count += 1;
+  }
+  return count;
+}
+
+// the index of the span starting at the offset, using that the spans are sorted by start
+function spanStartingAt(spans: Array<TermSpan>, offset: number): number | undefined {
+  let low = 0;
+  let high = spans.length - 1;
+  while (low <= high) {
+    const middle = (low + high) >>> 1;
+    const { start } = spans[middle];
+    if (start === offset) {
+      return middle;
+    }
+    if (start < offset) {
+      low = middle + 1;
+    } else {
+      high = middle - 1;
+    }
+  }
+  return undefined;
+}
+
+// Parses the search terms the same way spikeQuery does, continuing after the given spans
+// (which are extended in place). Before parsing each term, resync can provide the spans of
+// all the remaining terms to stop parsing early. Returns undefined if the input doesn't parse.
+function parseTermSpans(
+  input: string,
+  spans: Array<TermSpan>,
+  resync?: (offset: number) => Array<TermSpan> | undefined,
+): Array<TermSpan> | undefined {
+  let state: ParsingState = { input, offset: spans.length > 0 ? spans[spans.length - 1].end : 0 };
+  while (true) {
+    const termState = spans.length > 0 ? termDelimiter.parsePartial(state)[0] : state;
+
+    const rest = resync?.(termState.offset);
+    if (rest !== undefined) {
+      return spans.concat(rest);
+    }
+
+    const [s1, r] = searchTerm.parsePartial(termState);
+    if (r.type === "failure") {
+      break;
+    }
+    // the delimiters between the terms are white space, so only the terms contain backticks
+    const backticks = (spans.length > 0 ? spans[spans.length - 1].backticks : 0)
+      + countBackticks(input, termState.offset, s1.offset);
+    spans.push({ term: r.result, start: termState.offset, end: s1.offset, backticks });
+    state = s1;
+  }
+  return state.offset === input.length ? spans : undefined;
+}
+
+// The number of leading terms that are not affected by an edit at the given offset.
+// A term can't be affected if it's followed by white space before the edit: search terms
+// never look past white space, except for backtick quoted values, which is why we also
+// require an even number of backticks before the white space.
+function unaffectedTerms(text: string, spans: Array<TermSpan>, editStart: number): number {
+  for (let i = spans.length - 1; i >= 0; i--) {
+    const { end, backticks } = spans[i];
+    if (end < editStart && /\s/.test(text[end]) && backticks % 2 === 0) {
+      return i + 1;
+    }
+  }
+  return 0;
+}
+
+export interface IncrementalQueryParser {
+  // parses a new query from scratch
+  parse(queryString: string): ParsingResult<SpikeQuery>;
+  // replaces deleteCount characters at start with insertText, and parses the edited query
+  edit(start: number, deleteCount: number, insertText: string): ParsingResult<SpikeQuery>;
+  readonly text: string;
+}
+
+// A query parser for editors, which keeps the term offsets of the previous parse, so after an
+// edit only the affected terms are parsed again and spliced into the previous terms. Parsing
+// resumes before the edit, and stops once a term starts where a term started before the edit.
+export function createIncrementalQueryParser(): IncrementalQueryParser {
+  let text = "";
+  // undefined when the text doesn't parse
+  let spans: Array<TermSpan> | undefined = [];
+
+  const result = (): ParsingResult<SpikeQuery> => {
+    if (spans === undefined) {
+      // the failure is always reported by parsing the whole query
+      return parseStructuralQuery(text);
+    }
+    return { type: "success", result: { terms: spans.map(({ term }) => term) } };
+  };
+
+  return {
+    parse: (queryString: string) => {
+      text = queryString;
+      spans = parseTermSpans(text, []);
+      return result();
+    },
+    edit: (start: number, deleteCount: number, insertText: string) => {
+      const previousText = text;
+      const previous = spans;
+      text = previousText.substring(0, start) + insertText + previousText.substring(start + deleteCount);
+
+      if (previous === undefined) {
+        spans = parseTermSpans(text, []);
+        return result();
+      }
+
+      const delta = insertText.length - deleteCount;
+      const editEnd = start + insertText.length;
+      const backticksDelta = countBackticks(insertText, 0, insertText.length)
+        - countBackticks(previousText, start, start + deleteCount);
+
+      const resync = (offset: number) => {
+        const i = offset >= editEnd ? spanStartingAt(previous, offset - delta) : undefined;
+        return i === undefined ? undefined : previous.slice(i).map((span) => ({
+          term: span.term, start: span.start + delta, end: span.end + delta, backticks: span.backticks + backticksDelta,
+        }));
+      };
+
+      spans = parseTermSpans(text, previous.slice(0, unaffectedTerms(previousText, previous, start)), resync);
+      return result();
+    },
+    get text() {
+      return text;
+    },
+  };
+}
+
+// -------------- //
+// Cached Parsing //
+// -------------- //
+
+export interface CachedQueryParser {
+  parse(queryString: string): ParsingResult<SpikeQuery>;
+  readonly stats: CacheStats;
+}
+
+// A parseStructuralQuery with a bounded LRU cache of results by query string.
+// Cached results are deeply frozen and returned as is on every hit, so the same
+// result object is shared by everyone parsing the same query
+export function createCachedQueryParser(opts?: {capacity?: number; compiled?: boolean}): CachedQueryParser {
+  const cache = new LRUCache<string, ParsingResult<SpikeQuery>>(opts?.capacity ?? 10000);
+  const compiled = opts?.compiled ?? false;
+
+  return {
+    parse: (queryString: string) => {
+      let result = cache.get(queryString);
+      if (result === undefined) {
+        result = deepFreeze(parseStructuralQuery(queryString, { compiled }));
+        cache.set(queryString, result);
+      }
+      return result;
+    },
+    get stats() {
+      return cache.stats;
+    },
+  };
+}
+
+// -------------- //
+// Error Recovery //
+// -------------- //
+
+// a part of the query that couldn't be parsed as a search term, from start to end,
+// with the failure of parsing the search term at start
+export interface QueryDiagnostic {
+  start: number;
+  end: number;
+  expected: string;
+  got: string;
+  offset: number;
+}
+
+export interface RecoveredQuery {
+  terms: Array<SearchTerm>;
+  diagnostics: Array<QueryDiagnostic>;
+}
+
+// a run of white space or a run of anything else
+const resyncChunk = /\s+|\S+/y;
+
+// Parses the query in a single pass like parseStructuralQuery, but when a search term fails to
+// parse, the failure is reported as a diagnostic and parsing resumes at the next white space.
+// The terms are the same as parseStructuralQuery's when there are no diagnostics.
+export function parseStructuralQueryWithRecovery(queryString: string): RecoveredQuery {
+  const terms: Array<SearchTerm> = [];
+  const diagnostics: Array<QueryDiagnostic> = [];
+  let state: ParsingState = { input: queryString, offset: 0 };
+  while (state.offset < queryString.length) {
+    // the query can't start with white space, so it's only skipped between terms
+    const termState = state.offset > 0 ? termDelimiter.parsePartial(state)[0] : state;
+    const [s1, r] = searchTerm.parsePartial(termState);
+    if (r.type === "success") {
+      terms.push(r.result);
+      state = s1;
+    } else {
+      // the failure is parsed again with a context, to report what was expected
+      const failure = P.run(searchTerm, queryString, termState.offset);
+      resyncChunk.lastIndex = termState.offset;
+      const chunk = resyncChunk.exec(queryString);
+      const end = termState.offset + (chunk === null ? 0 : chunk[0].length);
+      if (failure.type === "failure") {
+        diagnostics.push({
+          start: termState.offset, end, expected: failure.expected, got: failure.got, offset: failure.offset,
+        });
+      }
+      state = { input: queryString, offset: end };
+    }
+  }
+  return { terms, diagnostics };
+}
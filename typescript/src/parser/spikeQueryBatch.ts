@@ -0,0 +1,133 @@
+import * as path from "path";
+import { Worker } from "worker_threads";
+import { ParsingResult } from "./parserCombinator";
+import { parseStructuralQuery, SpikeQuery, spikeQuery } from "./spikeQuery";
+import { parseStream } from "./streaming";
+
+// Node only parsing of many queries at once, kept apart from spikeQuery so that module
+// can be bundled for the browser without worker_threads and path
+
+// parses a stream of newline delimited queries, see parseStream
+export function parseStructuralQueryStream(
+  source: AsyncIterable<string | Uint8Array>,
+): AsyncGenerator<ParsingResult<SpikeQuery>> {
+  return parseStream(spikeQuery, source);
+}
+
+// ------------- //
+// Batch Parsing //
+// ------------- //
+
+// messages exchanged with the workers in spikeQueryWorker
+export interface QueryBatchRequest {
+  id: number;
+  queries: Array<string>;
+  compiled: boolean;
+}
+
+export interface QueryBatchResponse {
+  id: number;
+  results: Array<ParsingResult<SpikeQuery>>;
+}
+
+// Workers run the compiled spikeQueryWorker, or when running from the typescript sources
+// a bootstrap that compiles it with ts-node (which then has to be installed)
+function spawnQueryWorker(): Worker {
+  const fromSources = path.extname(__filename) === ".ts";
+  return new Worker(path.join(__dirname, fromSources ? "spikeQueryWorker.bootstrap.js" : "spikeQueryWorker.js"));
+}
+
+async function parseBatchesInProcess(
+  batches: Array<Array<string>>, compiled: boolean,
+): Promise<Array<Array<ParsingResult<SpikeQuery>>>> {
+  const results = [];
+  for (let i = 0; i < batches.length; i++) {
+    results.push(batches[i].map((query) => parseStructuralQuery(query, { compiled })));
+    // yield between batches so parsing many queries doesn't block the event loop
+    // eslint-disable-next-line no-await-in-loop
+    await new Promise((resolve) => setImmediate(resolve));
+  }
+  return results;
+}
+
+function parseBatchesInWorkers(
+  batches: Array<Array<string>>, workers: number, compiled: boolean,
+): Promise<Array<Array<ParsingResult<SpikeQuery>>>> {
+  return new Promise((resolve, reject) => {
+    const results: Array<Array<ParsingResult<SpikeQuery>>> = new Array(batches.length);
+    if (batches.length === 0) {
+      resolve(results);
+      return;
+    }
+
+    // every worker constructs the grammar once and then parses batches until none are left
+    const pool = Array.from({ length: Math.min(workers, batches.length) }, spawnQueryWorker);
+    let nextBatch = 0;
+    let parsedBatches = 0;
+    let finished = false;
+
+    const finish = (error?: Error) => {
+      if (finished) {
+        return;
+      }
+      finished = true;
+      pool.forEach((worker) => worker.terminate());
+      if (error !== undefined) {
+        reject(error);
+      } else {
+        resolve(results);
+      }
+    };
+
+    const dispatch = (worker: Worker) => {
+      if (nextBatch < batches.length) {
+        const request: QueryBatchRequest = { id: nextBatch, queries: batches[nextBatch], compiled };
+        worker.postMessage(request);
+        nextBatch += 1;
+      }
+    };
+
+    pool.forEach((worker) => {
+      worker.on("message", (response: QueryBatchResponse) => {
+        results[response.id] = response.results;
+        parsedBatches += 1;
+        if (parsedBatches === batches.length) {
+          finish();
+        } else {
+          dispatch(worker);
+        }
+      });
+      worker.on("error", finish);
+      // a worker exiting before all the batches are parsed (e.g. killed or out of memory)
+      // would otherwise leave its batch, and so the whole parse, pending forever
+      worker.on("exit", (code) => finish(new Error(`Query worker exited with code ${code} before parsing all the batches`)));
+      dispatch(worker);
+    });
+  });
+}
+
+// Parses many queries, returning the results in the order of the input queries.
+// Identical queries are only parsed once (and share the same result object), the rest are
+// parsed in batches, either in process or spread across the given number of worker threads
+export async function parseStructuralQueries(
+  queries: Array<string>,
+  opts?: {workers?: number; batchSize?: number; compiled?: boolean},
+): Promise<Array<ParsingResult<SpikeQuery>>> {
+  const workers = opts?.workers ?? 1;
+  const batchSize = opts?.batchSize ?? 1000;
+  const compiled = opts?.compiled ?? false;
+
+  const unique = [...new Set(queries)];
+  const batches: Array<Array<string>> = [];
+  for (let i = 0; i < unique.length; i += batchSize) {
+    batches.push(unique.slice(i, i + batchSize));
+  }
+
+  const parsed = workers > 1
+    ? await parseBatchesInWorkers(batches, workers, compiled)
+    : await parseBatchesInProcess(batches, compiled);
+
+  const resultsByQuery = new Map<string, ParsingResult<SpikeQuery>>();
+  batches.forEach((batch, i) => batch.forEach((query, j) => resultsByQuery.set(query, parsed[i][j])));
+  return queries.map((query) => resultsByQuery.get(query) as ParsingResult<SpikeQuery>);
+}
@@ -0,0 +1,5 @@
+// Entry point of the query workers when running from the typescript sources (e.g. under
+// ts-jest or ts-node): node can't start a worker from a .ts file, and the worker doesn't
+// inherit the require hooks of its parent, so it registers ts-node itself
+require("ts-node/register");
+require("./spikeQueryWorker.ts");
@@ -0,0 +1,14 @@
+import { parentPort } from "worker_threads";
+import { parseStructuralQuery } from "./spikeQuery";
+import { QueryBatchRequest, QueryBatchResponse } from "./spikeQueryBatch";
+
+// Worker thread used by parseStructuralQueries, the grammar is constructed once when
+// this module is loaded and then used to parse every batch sent to the worker
+
+parentPort?.on("message", ({ id, queries, compiled }: QueryBatchRequest) => {
+  const response: QueryBatchResponse = {
+    id,
+    results: queries.map((query) => parseStructuralQuery(query, { compiled })),
+  };
+  parentPort?.postMessage(response);
+});
@@ -0,0 +1,99 @@
+import { Parser, ParsingResult } from "./parserCombinator";
+
+// The input of a stream as a sequence of chunks, where the consumed chunks are released as
+// soon as reading passes them, so only the unconsumed input is kept in memory
+export class ChunkRope {
+  private readonly chunks: Array<string> = [];
+
+  // offset of the first unconsumed character in the first chunk
+  private head = 0;
+
+  private size = 0;
+
+  // the number of unconsumed characters
+  get length(): number {
+    return this.size;
+  }
+
+  append(chunk: string): void {
+    if (chunk.length > 0) {
+      this.chunks.push(chunk);
+      this.size += chunk.length;
+    }
+  }
+
+  // the position of the first occurrence of a single character in the unconsumed
+  // input, starting the search at position from, or -1 if it doesn't occur
+  indexOf(char: string, from = 0): number {
+    let chunkStart = 0;
+    for (let i = 0; i < this.chunks.length; i++) {
+      const chunk = this.chunks[i];
+      const head = i === 0 ? this.head : 0;
+      const chunkLength = chunk.length - head;
+      if (from < chunkStart + chunkLength) {
+        const found = chunk.indexOf(char, head + Math.max(0, from - chunkStart));
+        if (found >= 0) {
+          return chunkStart + found - head;
+        }
+      }
+      chunkStart += chunkLength;
+    }
+    return -1;
+  }
+
+  // removes and returns the first n unconsumed characters
+  take(n: number): string {
+    const parts: Array<string> = [];
+    let remaining = Math.min(n, this.size);
+    this.size -= remaining;
+    while (remaining > 0) {
+      const chunk = this.chunks[0];
+      const available = chunk.length - this.head;
+      if (remaining < available) {
+        parts.push(chunk.substring(this.head, this.head + remaining));
+        this.head += remaining;
+        remaining = 0;
+      } else {
+        parts.push(this.head === 0 ? chunk : chunk.substring(this.head));
+        this.chunks.shift();
+        this.head = 0;
+        remaining -= available;
+      }
+    }
+    return parts.join("");
+  }
+}
+
+// Parses a stream of newline delimited items (e.g. a file read with fs.createReadStream),
+// yielding the result of parsing each item, while skipping empty lines. Memory is bounded
+// by the size of the current item plus the chunk being read, as every item is parsed as
+// soon as its line ends and the chunks it was read from are released.
+export async function* parseStream<A>(
+  p: Parser<A>, source: AsyncIterable<string | Uint8Array>,
+): AsyncGenerator<ParsingResult<A>> {
+  const rope = new ChunkRope();
+  const decoder = new TextDecoder();
+
+  const parseItem = (line: string) => p.parse(line.endsWith("\r") ? line.substring(0, line.length - 1) : line);
+
+  for await (const chunk of source) {
+    // the part of the rope before this chunk was already searched for a line end
+    const searchFrom = rope.length;
+    rope.append(typeof chunk === "string" ? chunk : decoder.decode(chunk, { stream: true }));
+
+    let lineEnd = rope.indexOf("\n", searchFrom);
+    while (lineEnd >= 0) {
+      const line = rope.take(lineEnd + 1);
+      if (line.trim() !== "") {
+        yield parseItem(line.substring(0, lineEnd));
+      }
+      lineEnd = rope.indexOf("\n");
+    }
+  }
+
+  rope.append(decoder.decode());
+  const last = rope.take(rope.length);
+  if (last.trim() !== "") {
+    yield parseItem(last);
+  }
+}
@@ -18,3 +18,72 @@ export function reduce<A>(f: (a: A, b: A) => A, lst: Array<A>): A {
   });
   return result;
 }
+
+// recursively freezes an object and everything reachable from it
+export function deepFreeze<A>(a: A): A {
+  if (typeof a === "object" && a !== null && !Object.isFrozen(a)) {
+    Object.freeze(a);
+    Object.values(a).forEach(deepFreeze);
+  }
+  return a;
+}
+
+export interface CacheStats {
+  hits: number;
+  misses: number;
+  evictions: number;
+  size: number;
+}
+
+// A bounded cache evicting the least recently used entry once the capacity is reached.
+// Relies on Map iterating in insertion order, so a hit moves the entry to the end.
+export class LRUCache<K, V> {
+  private readonly entries = new Map<K, V>();
+
+  private readonly capacity: number;
+
+  private hits = 0;
+
+  private misses = 0;
+
+  private evictions = 0;
+
+  constructor(capacity: number) {
+    if (capacity < 1) {
+      throw new Error("LRU cache capacity must be at least 1");
+    }
+    this.capacity = capacity;
+  }
+
+  get(key: K): V | undefined {
+    const value = this.entries.get(key);
+    if (value === undefined) {
+      this.misses += 1;
+      return undefined;
+    }
+
+    this.hits += 1;
+    this.entries.delete(key);
+    this.entries.set(key, value);
+    return value;
+  }
+
+  set(key: K, value: V): void {
+    this.entries.delete(key);
+    if (this.entries.size >= this.capacity) {
+      const oldest = this.entries.keys().next().value as K;
+      this.entries.delete(oldest);
+      this.evictions += 1;
+    }
+    this.entries.set(key, value);
+  }
+
+  get stats(): CacheStats {
+    return {
+      hits: this.hits,
+      misses: this.misses,
+      evictions: this.evictions,
+      size: this.entries.size,
+    };
+  }
+}